@@ -40,5 +40,7 @@ setup(name='silva.core.xml',
       tests_require = tests_require,
       extras_require = {'test': tests_require},
       entry_points="""
+      [console_scripts]
+      silva-xml-benchmark = silva.core.xml.benchmarks.runner:main [test]
       """,
       )
@@ -8,8 +8,9 @@ NS_SILVA_URI = 'http://infrae.com/namespace/silva'
 NS_SILVA_CONTENT_URI = 'http://infrae.com/namespace/metadata/silva-content'
 NS_SILVA_EXTRA_URI = 'http://infrae.com/namespace/metadata/silva-extra'
 
-from silva.core.xml.xmlexport import Exporter, registerOption, registerNamespace
+from silva.core.xml.xmlexport import Exporter, ZipExporter
+from silva.core.xml.xmlexport import registerOption, registerNamespace
 from silva.core.xml.xmlimport import Importer, ZipImporter
 
-__all__ = ['Exporter', 'Importer', 'ZipImporter',
+__all__ = ['Exporter', 'ZipExporter', 'Importer', 'ZipImporter',
            'registerOption', 'registerNamespace']
@@ -0,0 +1,638 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import collections
+import io
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+
+# Extensions of files that are already compressed.
+COMPRESSED_EXTENSIONS = frozenset([
+        '.7z', '.avi', '.bz2', '.docx', '.flv', '.gif', '.gz', '.jar',
+        '.jpeg', '.jpg', '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.mpeg',
+        '.mpg', '.odp', '.ods', '.odt', '.ogg', '.pdf', '.png', '.pptx',
+        '.rar', '.swf', '.tgz', '.webm', '.webp', '.xlsx', '.xz', '.zip'])
+# Signatures of data that is already compressed.
+COMPRESSED_SIGNATURES = (
+    b'\xff\xd8\xff',                    # JPEG
+    b'\x89PNG',                         # PNG
+    b'GIF8',                            # GIF
+    b'%PDF',                            # PDF
+    b'PK\x03\x04',                      # Zip, office documents
+    b'\x1f\x8b',                        # gzip
+    b'BZh',                             # bzip2
+    b'\xfd7zXZ',                        # xz
+    b'7z\xbc\xaf',                      # 7z
+    b'Rar!',                            # RAR
+    b'ID3',                             # MP3
+    b'OggS',                            # Ogg
+    )
+
+
+class CompressionPolicy(object):
+    """Choose how each member of an archive is compressed. Members
+    that are already compressed, recognized by their extension or
+    their first bytes, are stored if store_compressed is true. The
+    other ones are compressed with compress_type.
+    """
+
+    def __init__(self, compress_type, store_compressed=True):
+        self.compress_type = compress_type
+        self.store_compressed = store_compressed
+
+    def getCompressType(self, name, data=None):
+        if self.store_compressed:
+            extension = os.path.splitext(name)[1].lower()
+            if extension in COMPRESSED_EXTENSIONS:
+                return zipfile.ZIP_STORED
+            if data is not None and (
+                data.startswith(COMPRESSED_SIGNATURES) or
+                data[4:8] == b'ftyp'):   # MP4, QuickTime
+                return zipfile.ZIP_STORED
+        return self.compress_type
+
+
+POLICIES = {
+    'stored': CompressionPolicy(zipfile.ZIP_STORED),
+    'deflate': CompressionPolicy(zipfile.ZIP_DEFLATED, False),
+    'auto': CompressionPolicy(zipfile.ZIP_DEFLATED),
+    }
+if lzma is not None and hasattr(zipfile, 'ZIP_LZMA'):
+    # Archives using LZMA can't be read by Python 2.
+    POLICIES['lzma'] = CompressionPolicy(zipfile.ZIP_LZMA)
+
+
+def get_policy(name):
+    """Return the compression policy registered under name.
+    """
+    try:
+        return POLICIES[name]
+    except KeyError:
+        raise ValueError('Unknown compression policy %s' % name)
+
+
+class ZipMember(object):
+    """Member of a Zip archive. Data written to it is compressed into
+    target, computing its checksum and sizes.
+    """
+
+    def __init__(self, name, compress_type, target):
+        self.name = name
+        self.compress_type = compress_type
+        self.target = target
+        self.crc = 0
+        self.file_size = 0
+        self.compress_size = 0
+        self.header_offset = None
+        self.version = 20
+        self.flag_bits = 0
+        self.zip64 = False
+        self._compressor = None
+        if compress_type == zipfile.ZIP_DEFLATED:
+            self._compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        elif compress_type != zipfile.ZIP_STORED:
+            # LZMA streams are terminated by an end marker.
+            self._compressor = zipfile.LZMACompressor()
+            self.version = 63
+            self.flag_bits = 0x02
+
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+        self.file_size += len(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self.target.write(data)
+            self.compress_size += len(data)
+
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
+
+    def finish(self):
+        if self._compressor is not None:
+            data = self._compressor.flush()
+            self._compressor = None
+            if data:
+                self.target.write(data)
+                self.compress_size += len(data)
+
+
+class CompressionJob(object):
+    """Compress data into a member in a thread of the pool. If the
+    member is compressed in more than one job, each job waits for the
+    previous one.
+    """
+
+    def __init__(self, member, data, finish=True, previous=None):
+        self.member = member
+        self.data = data
+        self.finish = finish
+        self.previous = previous
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            if self.previous is not None:
+                self.previous.result()
+                self.previous = None
+            self.member.write(self.data)
+            if self.finish:
+                self.member.finish()
+        except Exception as error:
+            self.error = error
+        finally:
+            self.data = None
+            self.done.set()
+
+    def result(self):
+        """Wait for the job to be done, and return its member.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.member
+
+
+class WorkerPool(object):
+    """Threads running jobs, compressing or inflating archive members.
+    zlib releases the GIL, so they run while the export or the import
+    goes on in the main thread.
+    """
+
+    def __init__(self, threads):
+        self._jobs = queue.Queue()
+        self._threads = []
+        for index in range(threads):
+            thread = threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __len__(self):
+        return len(self._threads)
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            job.run()
+
+    def submit(self, job):
+        # Jobs are started in the order they are submitted, a job
+        # waiting for a previous one can't deadlock the pool.
+        self._jobs.put(job)
+        return job
+
+    def close(self):
+        for thread in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class SharedFile(object):
+    """View with its own position on a file shared between threads.
+    Reads are done under lock.
+    """
+
+    def __init__(self, stream, lock, position=0):
+        self._stream = stream
+        self._lock = lock
+        self._position = position
+
+    def read(self, size=-1):
+        with self._lock:
+            self._stream.seek(self._position)
+            data = self._stream.read(size)
+            self._position = self._stream.tell()
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            with self._lock:
+                self._stream.seek(offset, 2)
+                offset = self._stream.tell()
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def map_view(mapping, start, end):
+    """Return a read-only view on a slice of a memory mapped file,
+    without copying it.
+    """
+    try:
+        return memoryview(mapping)[start:end]
+    except TypeError:
+        # Python 2 mappings only support the old buffer interface.
+        return buffer(mapping, start, end - start)
+
+
+class MappedFile(object):
+    """View with its own position on a memory mapped file. Data is
+    sliced out of the mapping without moving its position, so views
+    can be used from several threads without a lock.
+    """
+
+    def __init__(self, mapping, position=0):
+        self._mapping = mapping
+        self._position = position
+
+    def read(self, size=-1):
+        end = len(self._mapping)
+        if size is not None and size >= 0:
+            end = min(end, self._position + size)
+        data = self._mapping[self._position:end]
+        self._position += len(data)
+        return data
+
+    def view(self, start, end):
+        return map_view(self._mapping, start, end)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += len(self._mapping)
+        self._position = offset
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def get_data_offset(stream, info):
+    """Return the offset of the data of the member described by info,
+    after its local header.
+    """
+    stream.seek(info.header_offset)
+    header = struct.unpack(
+        zipfile.structFileHeader, stream.read(zipfile.sizeFileHeader))
+    return (info.header_offset + zipfile.sizeFileHeader +
+            header[zipfile._FH_FILENAME_LENGTH] +
+            header[zipfile._FH_EXTRA_FIELD_LENGTH])
+
+
+def inflate(stream, info, target, chunk_size=1 << 16):
+    """Inflate the deflated member described by info out of stream into
+    target, verifying its checksum.
+    """
+    stream.seek(get_data_offset(stream, info))
+    decompressor = zlib.decompressobj(-15)
+    remaining = info.compress_size
+    crc = 0
+    while remaining > 0:
+        data = stream.read(min(chunk_size, remaining))
+        if not data:
+            raise zipfile.BadZipfile(
+                'Truncated member %s' % info.filename)
+        remaining -= len(data)
+        data = decompressor.decompress(data)
+        crc = zlib.crc32(data, crc)
+        target.write(data)
+    data = decompressor.flush()
+    crc = zlib.crc32(data, crc)
+    target.write(data)
+    if crc & 0xffffffff != info.CRC:
+        raise zipfile.BadZipfile('Bad CRC-32 for member %s' % info.filename)
+
+
+class InflateJob(object):
+    """Inflate a member in a thread of the pool.
+    """
+
+    def __init__(self, func, info):
+        self.func = func
+        self.info = info
+        self.spool = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            self.spool = self.func(self.info)
+        except Exception as error:
+            self.error = error
+        finally:
+            self.done.set()
+
+    def result(self):
+        """Wait for the job to be done, and return the spool containing
+        the inflated member.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.spool
+
+
+class PooledMember(object):
+    """Collect data written to a member in chunks, that are compressed
+    in order by the pool.
+    """
+
+    def __init__(self, member, pool, chunk_size):
+        self.member = member
+        self.name = member.name
+        self._pool = pool
+        self._chunk_size = chunk_size
+        self._chunks = []
+        self._size = 0
+        self._jobs = collections.deque()
+
+    @property
+    def target(self):
+        return self.member.target
+
+    def _submit(self, finish=False):
+        previous = self._jobs[-1] if self._jobs else None
+        self._jobs.append(self._pool.submit(CompressionJob(
+                    self.member, b''.join(self._chunks), finish, previous)))
+        self._chunks = []
+        self._size = 0
+        # Limit the memory used by chunks waiting to be compressed.
+        while len(self._jobs) > 2 * len(self._pool):
+            self._jobs.popleft().result()
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_size:
+            self._submit()
+
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
+
+    def finish(self):
+        self._submit(finish=True)
+        while self._jobs:
+            self._jobs.popleft().result()
+
+
+class ZipWriter(object):
+    """Write a Zip archive to a stream, that doesn't need to be
+    seekable. Members are written one after the other, either from
+    data known in advance, from a spool, or streamed directly to the
+    output.
+
+    If threads is set, data known in advance and spooled members are
+    compressed by a pool of threads. Members are still written in the
+    order they are added.
+    """
+
+    def __init__(self, output, chunk_size=1 << 16, threads=0):
+        self._output = output
+        self._chunk_size = chunk_size
+        self._offset = 0
+        self._members = []
+        self._streaming = None
+        self._pool = None
+        self._pending = collections.deque()
+        if threads:
+            self._pool = WorkerPool(threads)
+        date_time = time.localtime(time.time())[:6]
+        self._time = (
+            date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2)
+        self._date = (
+            (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2])
+
+    def _write(self, data):
+        self._output.write(data)
+        self._offset += len(data)
+
+    def _encodeName(self, name):
+        if isinstance(name, bytes):
+            return name, 0
+        try:
+            return name.encode('ascii'), 0
+        except UnicodeEncodeError:
+            # Flag the name as UTF-8.
+            return name.encode('utf-8'), 0x800
+
+    def _writeHeader(self, member, streamed=False):
+        if self._streaming is not None:
+            raise ValueError('A member is being written')
+        name, flag_bits = self._encodeName(member.name)
+        member.header_offset = self._offset
+        member.flag_bits |= flag_bits
+        extra = b''
+        file_size = member.file_size
+        compress_size = member.compress_size
+        if streamed:
+            # Checksum and sizes follow the data.
+            member.flag_bits |= 0x08
+            if member.zip64:
+                extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+                file_size = compress_size = 0xffffffff
+                member.version = max(member.version, 45)
+        elif (file_size > zipfile.ZIP64_LIMIT or
+              compress_size > zipfile.ZIP64_LIMIT):
+            extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size)
+            file_size = compress_size = 0xffffffff
+            member.version = max(member.version, 45)
+        self._write(struct.pack(
+                zipfile.structFileHeader, zipfile.stringFileHeader,
+                member.version, 0, member.flag_bits, member.compress_type,
+                self._time, self._date, member.crc, compress_size,
+                file_size, len(name), len(extra)))
+        self._write(name)
+        self._write(extra)
+        self._members.append(member)
+
+    def _writePending(self, limit=0):
+        # Write compressed members in the order they were added.
+        while self._pending and (
+            len(self._pending) > limit or self._pending[0].done.is_set()):
+            member = self._pending.popleft().result()
+            self._writeHeader(member)
+            self._write(member.target.getvalue())
+            member.target = None
+
+    def spool(self, name, compress_type, spool_size):
+        """Return a member that compresses data into a spooled
+        temporary file. It is written to the archive with add.
+        """
+        member = ZipMember(
+            name, compress_type,
+            tempfile.SpooledTemporaryFile(max_size=spool_size))
+        if self._pool is not None and compress_type != zipfile.ZIP_STORED:
+            return PooledMember(member, self._pool, self._chunk_size)
+        return member
+
+    def add(self, member):
+        """Write a spooled member to the archive, and close its spool.
+        """
+        try:
+            member.finish()
+            if isinstance(member, PooledMember):
+                member = member.member
+            self._writePending()
+            self._writeHeader(member)
+            member.target.seek(0)
+            shutil.copyfileobj(member.target, self, self._chunk_size)
+        finally:
+            member.target.close()
+
+    def writestr(self, name, data, compress_type):
+        """Write a member with the given data to the archive.
+        """
+        member = ZipMember(name, compress_type, io.BytesIO())
+        if self._pool is not None and compress_type != zipfile.ZIP_STORED:
+            self._pending.append(
+                self._pool.submit(CompressionJob(member, data)))
+            # Limit the memory used by members waiting to be written.
+            self._writePending(2 * len(self._pool))
+            return
+        member.write(data)
+        member.finish()
+        self._writePending()
+        self._writeHeader(member)
+        self._write(member.target.getvalue())
+        member.target = None
+
+    def open(self, name, compress_type, size=None):
+        """Return a member that streams data directly to the
+        archive. It must be closed with closeMember before any other
+        member is written.
+
+        Its sizes are written with Zip64 structures, unless size is
+        given and small enough for the member to stay under the limit.
+        """
+        self._writePending()
+        member = ZipMember(name, compress_type, self)
+        # Compressed data can be slightly larger than its input.
+        member.zip64 = size is None or size * 1.05 > zipfile.ZIP64_LIMIT
+        self._writeHeader(member, streamed=True)
+        self._streaming = member
+        return member
+
+    def closeMember(self, member):
+        if self._streaming is not member:
+            raise ValueError('Member is not being written')
+        member.finish()
+        if not member.zip64 and (
+            member.file_size > zipfile.ZIP64_LIMIT or
+            member.compress_size > zipfile.ZIP64_LIMIT):
+            raise zipfile.LargeZipFile(
+                'Streamed member %s is larger than its given size' % (
+                    member.name))
+        self._streaming = None
+        self._write(struct.pack(
+                '<4sLQQ' if member.zip64 else '<4sLLL', b'PK\x07\x08',
+                member.crc, member.compress_size, member.file_size))
+        member.target = None
+
+    def write(self, data):
+        # Used to write member data.
+        self._write(data)
+
+    def discard(self):
+        """Stop the compression threads, without completing the
+        archive.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self._pending.clear()
+
+    def close(self):
+        """Write the central directory of the archive.
+        """
+        if self._streaming is not None:
+            raise ValueError('A member is being written')
+        try:
+            self._writePending()
+        finally:
+            self.discard()
+        start = self._offset
+        for member in self._members:
+            name, flag_bits = self._encodeName(member.name)
+            extra = []
+            file_size = member.file_size
+            compress_size = member.compress_size
+            header_offset = member.header_offset
+            if file_size > zipfile.ZIP64_LIMIT:
+                extra.append(file_size)
+                file_size = 0xffffffff
+            if compress_size > zipfile.ZIP64_LIMIT:
+                extra.append(compress_size)
+                compress_size = 0xffffffff
+            if header_offset > zipfile.ZIP64_LIMIT:
+                extra.append(header_offset)
+                header_offset = 0xffffffff
+            version = member.version
+            if extra:
+                extra = struct.pack(
+                    '<HH' + 'Q' * len(extra), 1, 8 * len(extra), *extra)
+                version = max(version, 45)
+            else:
+                extra = b''
+            self._write(struct.pack(
+                    zipfile.structCentralDir, zipfile.stringCentralDir,
+                    version, 3, version, 0, member.flag_bits,
+                    member.compress_type, self._time, self._date,
+                    member.crc, compress_size, file_size, len(name),
+                    len(extra), 0, 0, 0, 0o600 << 16, header_offset))
+            self._write(name)
+            self._write(extra)
+        end = self._offset
+        count = len(self._members)
+        size = end - start
+        if (count > zipfile.ZIP_FILECOUNT_LIMIT or
+            start > zipfile.ZIP64_LIMIT or
+            size > zipfile.ZIP64_LIMIT):
+            self._write(struct.pack(
+                    zipfile.structEndArchive64, zipfile.stringEndArchive64,
+                    44, 45, 45, 0, 0, count, count, size, start))
+            self._write(struct.pack(
+                    zipfile.structEndArchive64Locator,
+                    zipfile.stringEndArchive64Locator, 0, end, 1))
+            count = min(count, 0xffff)
+            start = min(start, 0xffffffff)
+            size = min(size, 0xffffffff)
+        self._write(struct.pack(
+                zipfile.structEndArchive, zipfile.stringEndArchive,
+                0, 0, count, count, size, start, 0))
+        if hasattr(self._output, 'flush'):
+            self._output.flush()
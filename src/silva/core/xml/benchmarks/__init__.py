@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+"""Benchmarks for the Silva XML export and import.
+
+They run inside the Silva functional test layer, on a synthetic site,
+and compare their results with stored baselines. They require the
+test dependencies, and are run with the ``silva-xml-benchmark``
+script.
+"""
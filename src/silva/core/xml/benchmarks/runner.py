@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import argparse
+import array
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import traceback
+
+from zope.component import getAdapter
+
+from Products.Silva.testing import FunctionalLayer, TestRequest, Transaction
+from silva.core.interfaces import IContentExporter
+from silva.core.xml import Exporter, ZipExporter, Importer, ZipImporter
+from silva.core.xml.archive import POLICIES
+from silva.core.xml.benchmarks.site import SiteGenerator
+from silva.core.xml.xmlimport import ImportedPaths
+
+import transaction
+
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+PROFILES = {
+    'small': {},
+    'medium': {'publications': 4, 'folders': 10, 'documents': 25},
+    'large': {'publications': 10, 'folders': 20, 'documents': 50,
+              'versions': 3, 'references': 20, 'assets': 5},
+    }
+
+BENCHMARKS = []
+
+
+def benchmark(name, fixture=None):
+    """Register a benchmark. It is called with the benchmark and the
+    result of fixture if one is given, and should return the number of
+    processed objects, or a tuple with the number of processed objects
+    and the size of the produced output, or of the used memory, in
+    bytes. The fixture is computed once, and is not included in the
+    timings.
+    """
+    def register(func):
+        BENCHMARKS.append((name, func, fixture))
+        return func
+    return register
+
+
+def deep_size(value, seen=None):
+    """Return the memory used by value and the objects it contains,
+    in bytes.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for item in value.items():
+            size += deep_size(item[0], seen) + deep_size(item[1], seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += deep_size(item, seen)
+    elif hasattr(value, '__dict__') and not isinstance(value, array.array):
+        size += deep_size(value.__dict__, seen)
+    return size
+
+
+def peak_rss():
+    """Return the peak resident set size of the process in bytes. Each
+    benchmark runs in its own forked process, whose peak starts at the
+    size of the process when it is forked.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux reports it in kilobytes.
+        peak *= 1024
+    return peak
+
+
+class Benchmark(object):
+    """Run benchmarks on a generated site.
+    """
+
+    def __init__(self, generator, repeat=1):
+        self.generator = generator
+        self.repeat = repeat
+        self.root = None
+        self.site = None
+
+    def setUp(self, root):
+        self.root = root
+        with Transaction():
+            self.site = self.generator.generate(root)
+
+    def measure(self, func, fixture=None):
+        if fixture is not None:
+            fixture = fixture(self)
+            transaction.abort()
+        timings = []
+        objects = 0
+        size = None
+        for index in range(self.repeat):
+            start = time.time()
+            try:
+                objects = func(self, fixture)
+            finally:
+                timings.append(time.time() - start)
+                transaction.abort()
+            if isinstance(objects, tuple):
+                objects, size = objects
+        seconds = min(timings)
+        result = {'seconds': seconds,
+                  'objects': objects,
+                  'objects_per_second': objects / seconds if seconds else 0,
+                  'peak_rss': peak_rss()}
+        if size is not None:
+            result['size'] = size
+        return result
+
+    def _measureIn(self, connection, func, fixture):
+        try:
+            connection.send(self.measure(func, fixture))
+        except:
+            connection.send({'error': traceback.format_exc()})
+        finally:
+            connection.close()
+
+    def measureProcess(self, name, func, fixture=None):
+        """Measure the benchmark in a forked process, so its peak
+        resident set size doesn't include the ones of the previous
+        benchmarks.
+        """
+        if fixture is not None:
+            # The fixture is computed before the process is forked, its
+            # memory is not counted in the peak.
+            value = fixture(self)
+            transaction.abort()
+            fixture = lambda bench: value
+        receiver, sender = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(
+            target=self._measureIn, args=(sender, func, fixture))
+        process.start()
+        sender.close()
+        try:
+            result = receiver.recv()
+        except EOFError:
+            # The process exited without sending its result.
+            result = None
+        finally:
+            receiver.close()
+            process.join()
+        if result is None:
+            raise RuntimeError('Benchmark %s failed: exit code %s' % (
+                    name, process.exitcode))
+        if 'error' in result:
+            raise RuntimeError(
+                'Benchmark %s failed: %s' % (name, result['error']))
+        return result
+
+    def run(self, names=None):
+        results = {}
+        for name, func, fixture in BENCHMARKS:
+            if names and name not in names:
+                continue
+            results[name] = self.measureProcess(name, func, fixture)
+        return results
+
+    def getImportFolder(self):
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('imported', 'Imported')
+        return self.root._getOb('imported')
+
+
+def export_xml(bench):
+    return Exporter(bench.site, TestRequest(), {}).getString()
+
+
+def export_zip(bench):
+    exporter = getAdapter(bench.site, IContentExporter, name='zip')
+    return exporter.export(TestRequest())
+
+
+@benchmark('export.getString')
+def export_string(bench, fixture):
+    export_xml(bench)
+    return bench.generator.count
+
+
+@benchmark('export.getStream')
+def export_stream(bench, fixture):
+    exporter = Exporter(bench.site, TestRequest(), {})
+    exporter.getStream().close()
+    return bench.generator.count
+
+
+@benchmark('export.writeTo')
+def export_write(bench, fixture):
+    exporter = Exporter(bench.site, TestRequest(), {})
+    with open(os.devnull, 'wb') as output:
+        exporter.writeTo(output)
+    return bench.generator.count
+
+
+@benchmark('export.writeTo.release_objects')
+def export_write_release(bench, fixture):
+    exporter = Exporter(bench.site, TestRequest(), {'release_objects': 100})
+    with open(os.devnull, 'wb') as output:
+        exporter.writeTo(output)
+    return bench.generator.count
+
+
+class NullOutput(object):
+    """Discard written data, counting its size.
+    """
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def zip_export_benchmark(compression, threads=None):
+    name = 'export.ZipExporter.%s' % compression
+    options = {'compression': compression}
+    if threads is not None:
+        name += '.%dthreads' % threads
+        options['compression_threads'] = threads
+
+    @benchmark(name)
+    def export_zip_stream(bench, fixture):
+        exporter = ZipExporter(bench.site, TestRequest(), options)
+        output = NullOutput()
+        exporter.writeTo(output)
+        return bench.generator.count, output.size
+
+
+@benchmark('export.ZipExporter.fragments')
+def export_zip_fragments(bench, fixture):
+    # Workers are forked: they open connections on their copy of the
+    # in-memory storage of the test layer.
+    database = bench.root._p_jar.db()
+    exporter = ZipExporter(bench.site, TestRequest(), {
+            'fragment_workers': 2,
+            'fragment_database': lambda: database})
+    output = NullOutput()
+    exporter.writeTo(output)
+    return bench.generator.count, output.size
+
+
+for compression in sorted(POLICIES):
+    zip_export_benchmark(compression)
+zip_export_benchmark('auto', 0)
+
+
+@benchmark('import.importStream', export_xml)
+def import_stream(bench, data):
+    importer = Importer(bench.getImportFolder(), TestRequest(), {})
+    importer.importStream(io.BytesIO(data))
+    return bench.generator.count
+
+
+@benchmark('import.importStream.defer_indexing', export_xml)
+def import_stream_defer_indexing(bench, data):
+    importer = Importer(
+        bench.getImportFolder(), TestRequest(), {'defer_indexing': True})
+    importer.importStream(io.BytesIO(data))
+    return bench.generator.count
+
+
+@benchmark('import.importStream.savepoints', export_xml)
+def import_stream_savepoints(bench, data):
+    importer = Importer(
+        bench.getImportFolder(), TestRequest(), {'savepoint_objects': 100})
+    importer.importStream(io.BytesIO(data))
+    return bench.generator.count
+
+
+@benchmark('import.ZipImporter', export_zip)
+def import_zip(bench, data):
+    importer = ZipImporter(bench.getImportFolder(), TestRequest(), {})
+    importer.importStream(io.BytesIO(data))
+    return bench.generator.count
+
+
+@benchmark('import.ZipImporter.0threads', export_zip)
+def import_zip_sync(bench, data):
+    importer = ZipImporter(
+        bench.getImportFolder(), TestRequest(), {'prefetch_threads': 0})
+    importer.importStream(io.BytesIO(data))
+    return bench.generator.count
+
+
+def export_zip_file(bench):
+    # The file is removed when the benchmark is done with it.
+    archive = tempfile.NamedTemporaryFile(suffix='.zip')
+    archive.write(export_zip(bench))
+    archive.flush()
+    return archive
+
+
+@benchmark('import.ZipImporter.importFile', export_zip_file)
+def import_zip_file(bench, archive):
+    importer = ZipImporter(bench.getImportFolder(), TestRequest(), {})
+    importer.importFile(archive.name)
+    return bench.generator.count
+
+
+def generate_paths(bench):
+    """Generate original and imported paths of content imported in
+    a renamed folder, a tenth of it being renamed as well.
+    """
+    paths = []
+    for index in range(bench.generator.count * 100):
+        folder = 'folder%d' % (index // 100)
+        original = ('root', 'site', folder, 'content%d' % index)
+        imported = ['root', 'imported', folder, 'content%d' % index]
+        if index % 10 == 0:
+            imported[-1] = 'import_of_' + imported[-1]
+        paths.append((original, tuple(imported)))
+    return paths
+
+
+@benchmark('import.ImportedPaths', generate_paths)
+def imported_paths(bench, paths):
+    imported = ImportedPaths()
+    for original, path in paths:
+        imported.set(original, path)
+    for original, path in paths:
+        imported.get(original)
+    return len(paths), deep_size(imported)
+
+
+@benchmark('import.ImportedPaths.dict', generate_paths)
+def imported_paths_dict(bench, paths):
+    # The dictionary of joined paths used before, for comparison.
+    imported = {}
+    for original, path in paths:
+        imported[u'/'.join(original)] = u'/'.join(path)
+    for original, path in paths:
+        imported.get(u'/'.join(original))
+    return len(paths), deep_size(imported)
+
+
+def load_baselines(filename=BASELINES):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r') as stream:
+        return json.load(stream)
+
+
+def save_baselines(baselines, filename=BASELINES):
+    with open(filename, 'w') as stream:
+        json.dump(baselines, stream, indent=2, separators=(',', ': '),
+                  sort_keys=True)
+        stream.write('\n')
+
+
+def compare(results, baselines, tolerance):
+    """Return a list of regressions of results against the baselines.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        baseline = baselines.get(name)
+        if baseline is None:
+            continue
+        expected = baseline['objects_per_second'] * (1 - tolerance)
+        if result['objects_per_second'] < expected:
+            regressions.append(
+                '%s: %.1f objects/s, baseline %.1f objects/s' % (
+                    name, result['objects_per_second'],
+                    baseline['objects_per_second']))
+        expected = baseline['peak_rss'] * (1 + tolerance)
+        if result['peak_rss'] > expected:
+            regressions.append(
+                '%s: peak RSS %d MB, baseline %d MB' % (
+                    name, result['peak_rss'] >> 20,
+                    baseline['peak_rss'] >> 20))
+        if 'size' in baseline and 'size' in result:
+            expected = baseline['size'] * (1 + tolerance)
+            if result['size'] > expected:
+                regressions.append(
+                    '%s: size %d KB, baseline %d KB' % (
+                        name, result['size'] >> 10, baseline['size'] >> 10))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Silva XML export and import.')
+    parser.add_argument(
+        '--profile', choices=sorted(PROFILES), default='small',
+        help='size of the generated site')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of runs of each benchmark, the best one is kept')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='allowed relative regression against the baselines')
+    parser.add_argument(
+        '--baselines', default=BASELINES,
+        help='file containing the baselines')
+    parser.add_argument(
+        '--update', action='store_true',
+        help='store the results as new baselines')
+    parser.add_argument(
+        'names', nargs='*', help='benchmarks to run (default all)')
+    args = parser.parse_args(argv)
+
+    layer = FunctionalLayer
+    layer.setUp()
+    layer.testSetUp()
+    try:
+        layer.login('manager')
+        generator = SiteGenerator(**PROFILES[args.profile])
+        bench = Benchmark(generator, repeat=args.repeat)
+        bench.setUp(layer.get_application())
+        results = bench.run(args.names)
+    finally:
+        layer.testTearDown()
+        layer.tearDown()
+
+    for name, result in sorted(results.items()):
+        line = '%-36s %8.3fs %10.1f objects/s %6d MB' % (
+            name, result['seconds'], result['objects_per_second'],
+            result['peak_rss'] >> 20)
+        if 'size' in result:
+            line += ' %10d KB' % (result['size'] >> 10)
+        print(line)
+
+    baselines = load_baselines(args.baselines)
+    if args.update:
+        baseline = baselines.get(args.profile)
+        if baseline is None or baseline['site'] != generator.options():
+            baseline = baselines[args.profile] = {
+                'site': generator.options(),
+                'results': {}}
+        # The baselines of the benchmarks that didn't run are kept.
+        baseline['results'].update(results)
+        save_baselines(baselines, args.baselines)
+        return 0
+    baseline = baselines.get(args.profile)
+    if baseline is None:
+        print('No baselines for profile %s.' % args.profile)
+        return 0
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print('Regression: %s' % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import io
+import random
+
+from zope.component import getUtility
+
+from silva.core.interfaces import IPublicationWorkflow
+from silva.core.services.interfaces import IMetadataService
+
+
+METADATA_VALUES = [
+    ('silva-extra', 'comment', 'Generated for benchmarking.'),
+    ('silva-extra', 'content_description', 'A synthetic content.'),
+    ('silva-extra', 'keywords', 'benchmark xml'),
+    ('silva-extra', 'subject', 'Benchmark'),
+    ]
+
+
+class SiteGenerator(object):
+    """Create a synthetic Silva site used to benchmark the XML export
+    and import.
+
+    The site contains publications, each of them containing folders.
+    Folders contains links (versioned contents) with versions and
+    metadata, ghosts refering to those links, and files. Files are
+    alternatively JPEG images (random data) and text.
+    """
+
+    def __init__(self, publications=2, folders=5, documents=10, versions=2,
+                 metadata=2, references=5, assets=2, asset_size=16384,
+                 seed=42):
+        self.publications = publications
+        self.folders = folders
+        self.documents = documents
+        self.versions = versions
+        self.metadata = METADATA_VALUES[:metadata]
+        self.references = references
+        self.assets = assets
+        self.asset_size = asset_size
+        self.seed = seed
+        # Number of created objects, including versions.
+        self.count = 0
+
+    def options(self):
+        return {'publications': self.publications,
+                'folders': self.folders,
+                'documents': self.documents,
+                'versions': self.versions,
+                'metadata': len(self.metadata),
+                'references': self.references,
+                'assets': self.assets,
+                'asset_size': self.asset_size}
+
+    def generate(self, parent, identifier='benchmark'):
+        """Create the site inside the given parent. Return the top
+        level folder of the site.
+        """
+        randomizer = random.Random(self.seed)
+        self.count = 0
+        site = self._addContainer(parent, 'manage_addFolder', identifier)
+        for index in range(self.publications):
+            publication = self._addContainer(
+                site, 'manage_addPublication', 'publication%d' % index)
+            for index in range(self.folders):
+                folder = self._addContainer(
+                    publication, 'manage_addFolder', 'folder%d' % index)
+                self._fillFolder(folder, randomizer)
+        return site
+
+    def _addContainer(self, parent, method, identifier):
+        factory = parent.manage_addProduct['Silva']
+        getattr(factory, method)(identifier, identifier.capitalize())
+        container = parent._getOb(identifier)
+        self._setMetadata(container)
+        self.count += 1
+        return container
+
+    def _setMetadata(self, content):
+        if not self.metadata:
+            return
+        binding = getUtility(IMetadataService).getMetadata(content)
+        for set_id, element_id, value in self.metadata:
+            binding.setValues(set_id, {element_id: value}, reindex=0)
+
+    def _fillFolder(self, folder, randomizer):
+        factory = folder.manage_addProduct['Silva']
+        documents = []
+        for index in range(self.documents):
+            identifier = 'document%d' % index
+            factory.manage_addLink(
+                identifier, 'Document %d' % index,
+                url='http://infrae.com/%d' % index, relative=False)
+            document = folder._getOb(identifier)
+            workflow = IPublicationWorkflow(document)
+            for version in range(1, self.versions):
+                workflow.publish()
+                workflow.new_version()
+            self._setMetadata(document.get_editable())
+            documents.append(document)
+            self.count += self.versions + 1
+        for index in range(self.references):
+            if not documents:
+                break
+            target = documents[index % len(documents)]
+            factory.manage_addGhost(
+                'reference%d' % index, None, haunted=target)
+            self.count += 2
+        for index in range(self.assets):
+            if index % 2:
+                payload = (b'Line %d of a text file.\n' % index) * (
+                    self.asset_size // 24)
+                identifier = 'asset%d.txt' % index
+            else:
+                payload = b'\xff\xd8\xff' + bytes(bytearray(
+                        randomizer.getrandbits(8)
+                        for i in range(self.asset_size)))
+                identifier = 'asset%d.jpg' % index
+            factory.manage_addFile(
+                identifier, 'Asset %d' % index, io.BytesIO(payload))
+            self.count += 1
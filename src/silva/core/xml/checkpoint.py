@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import bisect
+import collections
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class Checkpoint(object):
+    """Progress of an import, saved in a file each time the import is
+    committed.
+
+    Elements are numbered by their offset in the XML. The ranges of
+    elements of the contents that are imported and committed are kept,
+    unless the content queued actions that are still pending. When an
+    import is resumed, the elements of those ranges are skipped.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0
+        self.ranges = []
+        self.skipped = collections.deque()
+        self.__starts = []
+        self.__pending = []
+
+    def load(self):
+        """Load the saved state of the import, if any. The ranges of
+        the saved state are skipped.
+        """
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, 'rb') as stream:
+            state = pickle.load(stream)
+        self.skipped = collections.deque(state['ranges'])
+        return state
+
+    def save(self, state):
+        """Save the state of the import, with the current ranges.
+        """
+        state = dict(state, offset=self.offset, ranges=self.ranges)
+        filename = self.filename + '.tmp'
+        with open(filename, 'wb') as stream:
+            pickle.dump(state, stream, pickle.HIGHEST_PROTOCOL)
+        # Replace the previous state at once.
+        if os.name == 'nt' and os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(filename, self.filename)
+
+    def remove(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def start(self):
+        """Start a new element. Return True if it is part of a range
+        to skip.
+        """
+        start = self.offset
+        self.__starts.append(start)
+        self.offset += 1
+        while self.skipped and self.skipped[0][1] <= start:
+            self.skipped.popleft()
+        if self.skipped and self.skipped[0][0] <= start:
+            if self.skipped[0][0] == start:
+                # The range is still imported for the next checkpoint.
+                self.complete(*self.skipped[0])
+            return True
+        return False
+
+    def end(self):
+        self.__starts.pop()
+
+    def queued(self):
+        """Remember that an action was queued by the current element.
+        """
+        if self.__starts:
+            bisect.insort(self.__pending, self.__starts[-1])
+
+    def complete(self, start=None, end=None):
+        """Mark the range of elements, by default the ones of the
+        current element, as completely imported.
+        """
+        if start is None:
+            if not self.__starts:
+                return
+            start, end = self.__starts[-1], self.offset
+        index = bisect.bisect_left(self.__pending, start)
+        if index < len(self.__pending) and self.__pending[index] < end:
+            # This range queued actions that cannot be saved.
+            return
+        # The range contains the ranges completed before it.
+        while self.ranges and self.ranges[-1][0] >= start:
+            self.ranges.pop()
+        if self.ranges and self.ranges[-1][1] == start:
+            start = self.ranges.pop()[0]
+        self.ranges.append((start, end))
+
+
+class CheckpointHandler(object):
+    """SAX filter numbering the elements of an import, that skips the
+    elements of already imported ranges.
+    """
+
+    def __init__(self, output, checkpoint):
+        self._output = output
+        self._checkpoint = checkpoint
+        self._skipping = 0
+
+    def startElementNS(self, name, qname, attrs):
+        # Skipped elements are numbered as well.
+        if self._checkpoint.start() or self._skipping:
+            self._skipping += 1
+            return
+        self._output.startElementNS(name, qname, attrs)
+
+    def endElementNS(self, name, qname):
+        if self._skipping:
+            self._skipping -= 1
+        else:
+            self._output.endElementNS(name, qname)
+        self._checkpoint.end()
+
+    def characters(self, content):
+        if not self._skipping:
+            self._output.characters(content)
+
+    def ignorableWhitespace(self, content):
+        if not self._skipping:
+            self._output.ignorableWhitespace(content)
+
+    def processingInstruction(self, target, data):
+        if not self._skipping:
+            self._output.processingInstruction(target, data)
+
+    def __getattr__(self, name):
+        return getattr(self._output, name)
@@ -14,11 +14,13 @@ class ProblemHandler(handlers.BaseHandler):
     """Collect a problem that is given in the XML.
     """
     _path = None
+    _count = 1
     _message = None
 
     def startElementNS(self, name, qname, attrs):
         if name == (NS_SILVA_URI, 'problem'):
-            self._path = attrs.get((None, 'path'), '')
+            self._path = attrs.get((None, 'path'))
+            self._count = int(attrs.get((None, 'count'), 1))
             self._message = []
 
     def characters(self, chars):
@@ -29,9 +31,15 @@ class ProblemHandler(handlers.BaseHandler):
         if name == (NS_SILVA_URI, 'problem'):
             imported = self.getExtra()
             message = ''.join(self._message).strip()
+            count = self._count
+
+            if self._path is None:
+                # Problem without content, summarized by the export.
+                imported.reportProblem(message, None, count)
+                return
 
             def report(content):
-                imported.reportProblem(message, content)
+                imported.reportProblem(message, content, count)
 
             imported.resolveImportedPath(imported.root, report, self._path)
 
@@ -41,16 +49,18 @@ class SilvaExportRootHandler(handlers.SilvaHandler):
     """
     grok.name('silva')
 
+    _overrides = {
+        (NS_SILVA_URI, 'problem'): ProblemHandler
+        }
+
     def getOverrides(self):
-        return {
-            (NS_SILVA_URI, 'problem'): ProblemHandler
-            }
+        return self._overrides
 
     def getResultPhysicalPath(self):
-        return []
+        return ()
 
     def getOriginalPhysicalPath(self):
-        return []
+        return ()
 
     def isTopLevelHandler(self):
         return True
@@ -61,15 +71,17 @@ class VersionHandler(handlers.RegisteredHandler):
     """
     grok.name('version')
 
+    _overrides = {
+        (NS_SILVA_URI, 'status'):
+            handlers.handlerFactories.contentHandler('status'),
+        (NS_SILVA_URI, 'publication_datetime'):
+            handlers.handlerFactories.contentHandler('publication_datetime'),
+        (NS_SILVA_URI, 'expiration_datetime'):
+            handlers.handlerFactories.contentHandler('expiration_datetime'),
+        }
+
     def getOverrides(self):
-        return {
-            (NS_SILVA_URI, 'status'):
-                self.handlerFactories.contentHandler('status'),
-            (NS_SILVA_URI, 'publication_datetime'):
-                self.handlerFactories.contentHandler('publication_datetime'),
-            (NS_SILVA_URI, 'expiration_datetime'):
-                self.handlerFactories.contentHandler('expiration_datetime'),
-            }
+        return self._overrides
 
     def startElementNS(self, name, qname, attrs):
         if name == (NS_SILVA_URI, 'version'):
@@ -6,12 +6,11 @@ import logging
 
 from five import grok
 from sprout.saxext.xmlimport import BaseHandler
-from zope.event import notify
 
 from DateTime import DateTime
 
 from silva.core.xml import NS_SILVA_URI
-from silva.core.interfaces import ISilvaXMLHandler, ContentImported
+from silva.core.interfaces import ISilvaXMLHandler
 from silva.core.interfaces import ISilvaObject, IVersion
 
 
@@ -25,38 +24,50 @@ def parse_date(date):
 
 
 class DynamicHandlers(object):
+    """Create handlers that set data on the handler overriding elements
+    with them. Created handlers are cached, as they only depend on
+    their parameters.
+    """
 
-    def __init__(factory, handler):
-        factory._handler = handler
+    def __init__(factory):
+        factory._handlers = {}
 
     def tagHandler(factory, tag, namespace=NS_SILVA_URI):
+        key = ('tag', tag, namespace)
+        handler = factory._handlers.get(key)
+        if handler is None:
 
-        class IdentifierHandler(SilvaHandler):
+            class IdentifierHandler(DynamicHandler):
 
-            def startElementNS(self, name, qname, attrs):
-                if name == (namespace, tag):
-                    factory._handler.setData(tag, attrs[(None, 'id')])
+                def startElementNS(self, name, qname, attrs):
+                    if name == (namespace, tag):
+                        self.getOwner().setData(tag, attrs[(None, 'id')])
 
-        return IdentifierHandler
+            handler = factory._handlers[key] = IdentifierHandler
+        return handler
 
     def contentHandler(factory, name):
+        key = ('content', name)
+        handler = factory._handlers.get(key)
+        if handler is None:
+
+            class CharacterHandler(DynamicHandler):
 
-        class CharacterHandler(SilvaHandler):
+                def characters(self, chars):
+                    return self.getOwner().setData(name, chars.strip())
 
-            def characters(self, chars):
-                return factory._handler.setData(name, chars.strip())
+            handler = factory._handlers[key] = CharacterHandler
+        return handler
 
-        return CharacterHandler
+
+handlerFactories = DynamicHandlers()
 
 
 class RegisteredHandler(BaseHandler):
     """Base class to define an XML importer for a generic tag.
     """
     grok.baseclass()
-
-    def __init__(self, parent, parent_handler, options=None, extra=None):
-        super(RegisteredHandler, self).__init__(parent, parent_handler, options, extra)
-        self.handlerFactories = DynamicHandlers(self)
+    handlerFactories = handlerFactories
 
 
 class Handler(RegisteredHandler):
@@ -66,12 +77,13 @@ class Handler(RegisteredHandler):
     grok.baseclass()
     grok.implements(ISilvaXMLHandler)
 
-    def __init__(self, parent, parent_handler, options=None, extra=None):
-        super(Handler, self).__init__(parent, parent_handler, options, extra)
-        self._metadata = {}
-        self._workflow = {}
-        self.__id_result = None
-        self.__id_original = None
+    # Those are only set on the instance when used.
+    _metadata = None
+    _workflow = None
+    __id_result = None
+    __id_original = None
+    __path_result = None
+    __path_original = None
 
     # MANIPULATORS
 
@@ -83,7 +95,7 @@ class Handler(RegisteredHandler):
             # The result was not created here.
             return
         importer = self.getExtra()
-        importer.addAction(notify, [ContentImported(self.result())])
+        importer.notifyImported(self.getResultPhysicalPath())
         importer.addImportedPath(
             self.getOriginalPhysicalPath(),
             self.getResultPhysicalPath())
@@ -93,30 +105,37 @@ class Handler(RegisteredHandler):
 
     def setResultId(self, identifier):
         self.__id_result = identifier
+        self.__path_result = None
+        self.__path_original = None
         return self.setResult(self.parent()._getOb(identifier))
 
     def setOriginalId(self, identifier):
         self.__id_original = identifier
+        self.__path_original = None
 
     def getResultPhysicalPath(self):
-        parent = self.parentHandler()
-        if parent is None:
-            return []
-        path = parent.getResultPhysicalPath()
-        trail = self.__id_result
-        if trail is not None:
-            path.append(trail)
-        return path
+        if self.__path_result is None:
+            parent = self.parentHandler()
+            if parent is None:
+                return ()
+            path = tuple(parent.getResultPhysicalPath())
+            trail = self.__id_result
+            if trail is not None:
+                path += (trail,)
+            self.__path_result = path
+        return self.__path_result
 
     def getOriginalPhysicalPath(self):
-        parent = self.parentHandler()
-        if parent is None:
-            return []
-        path = parent.getOriginalPhysicalPath()
-        trail = self.__id_original or self.__id_result
-        if trail is not None:
-            path.append(trail)
-        return path
+        if self.__path_original is None:
+            parent = self.parentHandler()
+            if parent is None:
+                return ()
+            path = tuple(parent.getOriginalPhysicalPath())
+            trail = self.__id_original or self.__id_result
+            if trail is not None:
+                path += (trail,)
+            self.__path_original = path
+        return self.__path_original
 
     def isTopLevelHandler(self):
         return False
@@ -124,37 +143,37 @@ class Handler(RegisteredHandler):
     # Metadata helpers
     def setMetadata(self, key, values):
         assert isinstance(values, dict)
+        if self._metadata is None:
+            self._metadata = {}
         self._metadata[key] = values
 
     def getMetadata(self, set, key):
+        if self._metadata is None:
+            raise KeyError(set)
         return self._metadata[set].get(key)
 
     def storeMetadata(self):
-        if not self.resultIsImported():
+        if not self.resultIsImported() or not self._metadata:
             return
         content = self.result()
         metadata_service = content.service_metadata
         binding = metadata_service.getMetadata(content)
         if binding is not None and not binding.read_only:
-            set_names = binding.getSetNames()
+            importer = self.getExtra()
+            schema = importer.getMetadataSchema(binding)
             for set_id, elements in self._metadata.items():
-                if set_id not in set_names:
-                    logger.warn(
-                        u"Unknown metadata set %s present in import file.",
-                        set_id)
+                fields = schema.get(set_id)
+                if fields is None:
+                    importer.reportUnknownMetadata(set_id)
                     continue
-                element_names = binding.getElementNames(set_id, mode='write')
                 values = {}
-                for element_id, element in elements.iteritems():
-                    if element_id not in element_names:
-                        logger.warn(
-                            u"Unknown metadata element %s in set %s present "
-                            u"in import file.",
-                            element_id, set_id)
+                for element_id, value in elements.iteritems():
+                    descriptor = fields.get(element_id)
+                    if descriptor is None:
+                        importer.reportUnknownMetadata(set_id, element_id)
                         continue
-                    field = binding.getElement(set_id, element_id).field
-                    values[element_id] = field.validator.deserializeValue(
-                        field, elements[element_id], self)
+                    field, deserialize = descriptor
+                    values[element_id] = deserialize(field, value, self)
 
                 if values:
                     errors = binding.setValues(set_id, values, reindex=0)
@@ -165,13 +184,17 @@ class Handler(RegisteredHandler):
     # Workflow helpers
     def setWorkflowVersion(
         self, version_id, publication_time, expiration_time, status):
+        if self._workflow is None:
+            self._workflow = {}
         self._workflow[version_id.strip()] = (
             parse_date(publication_time),
             parse_date(expiration_time),
             status)
 
     def getWorkflowVersion(self, version_id):
-        info = self._workflow.get(version_id)
+        info = None
+        if self._workflow is not None:
+            info = self._workflow.get(version_id)
         if info is None:
             # The information is missing, create a problem and return
             # a closed information.
@@ -203,27 +226,23 @@ class SilvaHandler(Handler):
 
     def _generateIdentifier(self, attrs, key='id', namespace=None):
         options = self.getOptions()
+        importer = self.getExtra()
         parent = self.parent()
         identifier = self._readOriginalIdentifier(attrs, key, namespace)
-        existing = parent.objectIds()
+        existing = importer.hasIdentifier(parent, identifier)
         if options.replace_content:
-            if identifier in existing:
+            if existing:
                 parent.manage_delObjects([identifier])
+            importer.addIdentifier(parent, identifier)
             return (identifier, False)
         if options.update_content:
-            if identifier in existing:
+            if existing:
                 if self._verifyContent(parent._getOb(identifier)):
                     # Reuse the content only if it match or create a new one.
                     return (identifier, True)
         # Find a new id
-        test = 0
-        original = identifier
-        while identifier in existing:
-            test += 1
-            add = ''
-            if test > 1:
-                add = str(test)
-            identifier = 'import%s_of_%s' % (add, original)
+        identifier = importer.getUniqueIdentifier(parent, identifier)
+        importer.addIdentifier(parent, identifier)
         return (identifier, False)
 
     def createContent(self, attrs, key='id', namespace=None, options={}):
@@ -238,6 +257,23 @@ class SilvaHandler(Handler):
         return identifier
 
 
+class DynamicHandler(SilvaHandler):
+    """Base class of the handlers created by DynamicHandlers.
+    """
+    grok.baseclass()
+
+    def getOwner(self):
+        """Return the closest parent handler overriding elements with
+        this handler, or the parent handler if there is none.
+        """
+        handler = self.parentHandler()
+        while handler is not None:
+            if self.__class__ in handler.getOverrides().values():
+                return handler
+            handler = handler.parentHandler()
+        return self.parentHandler()
+
+
 class SilvaContainerHandler(SilvaHandler):
 
     def createContent(self, attrs, key='id', namespace=None, options={}):
@@ -263,17 +299,21 @@ class SilvaVersionHandler(Handler):
             raise ValueError('Version identifier is missing')
         identifier = identifier.encode('utf-8')
         create = True
+        importer = self.getExtra()
         parent = self.parent()
-        existing = parent.objectIds()
+        existing = importer.hasIdentifier(parent, identifier)
         self.setOriginalId(identifier)
         if options.replace_content:
-            if identifier in existing:
+            if existing:
                 parent.manage_delObjects([identifier])
+                importer.removeIdentifier(parent, identifier)
+                existing = False
         if options.update_content:
-            if identifier in existing:
+            if existing:
                 create = False
         if create:
             self._createVersion(identifier, **opts)
+            importer.addIdentifier(parent, identifier)
         version = self.setResultId(identifier)
         assert IVersion.providedBy(version)
         return version
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import logging
+
+from silva.core.services.catalog import CatalogingTask
+
+logger = logging.getLogger('silva.core.xml')
+
+# Attributes of the cataloging task holding the collected requests.
+# They are not part of its API.
+TASK_ATTRIBUTES = ('_active', '_index', '_unindex')
+
+
+class DeferredIndexing(object):
+    """Defer the cataloging of content during an import, to catalog
+    it in batches of batch_size contents at the end.
+
+    Cataloging requests are collected by the cataloging task of the
+    transaction, the way it is done during upgrades. A content
+    indexed several times is only cataloged once. If the task doesn't
+    store them where expected, content is cataloged immediately.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = max(1, batch_size)
+        self.task = None
+        self.collecting = False
+        self.supported = True
+
+    def start(self):
+        """Start collecting the cataloging requests.
+        """
+        self.task = task = CatalogingTask.get()
+        if not all(hasattr(task, name) for name in TASK_ATTRIBUTES):
+            if self.supported:
+                logger.warning(
+                    u"Cannot defer the cataloging of imported content.")
+            self.supported = False
+            self.collecting = False
+            return
+        # If the task already collects them (during an upgrade), they
+        # are cataloged at the end of the transaction, as usual.
+        self.collecting = not task._active
+        task.activate()
+
+    def __len__(self):
+        if not self.collecting:
+            return 0
+        return len(self.task._index) + len(self.task._unindex)
+
+    def flush(self):
+        """Catalog the collected content and stop collecting. Return
+        the number of cataloged and uncataloged contents.
+        """
+        if not self.collecting:
+            return 0
+        task = self.task
+        index, unindex = task._index, task._unindex
+        task._index, task._unindex = {}, {}
+        task._active = False
+        self.collecting = False
+        total = len(index) + len(unindex)
+        if unindex:
+            CatalogingTask(True, unindex=unindex).finish()
+        done = len(unindex)
+        # Catalog in path order, containers before their contents.
+        paths = sorted(index)
+        for start in range(0, len(paths), self.batch_size):
+            batch = paths[start:start + self.batch_size]
+            todo = dict((path, index.pop(path)) for path in batch)
+            CatalogingTask(True, index=todo).finish()
+            done += len(batch)
+            logger.info(u"Cataloged %d of %d imported contents.", done, total)
+        return total
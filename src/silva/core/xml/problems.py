@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import collections
+
+
+class Problems(object):
+    """Problems reported during an export or an import.
+
+    A problem is kept as the physical path of its content and its
+    reason, with a count of identical reports. Reasons are shared
+    between problems. Above limit distinct problems, new ones are only
+    counted by reason, and above limit reasons, only counted.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.dropped = 0
+        self._problems = collections.OrderedDict()
+        self._overflow = collections.OrderedDict()
+        self._reasons = {}
+
+    def add(self, reason, content=None, count=1):
+        path = None
+        if content is not None:
+            path = content.getPhysicalPath()
+        self.addPath(reason, path, count)
+
+    def addPath(self, reason, path, count=1):
+        """Add a problem about the content at the physical path,
+        without needing the content itself.
+        """
+        reason = self._reasons.setdefault(reason, reason)
+        key = (reason, path)
+        if key in self._problems:
+            self._problems[key] += count
+        elif self.limit is None or len(self._problems) < self.limit:
+            self._problems[key] = count
+        elif reason in self._overflow:
+            self._overflow[reason] += count
+        elif len(self._overflow) < self.limit:
+            self._overflow[reason] = count
+        else:
+            self.dropped += count
+
+    def __len__(self):
+        return (sum(self._problems.values()) +
+                sum(self._overflow.values()) + self.dropped)
+
+    def __iter__(self):
+        """Iterate over the problems as (reason, path, count), in the
+        order they were first reported. Problems above the limit have
+        no path.
+        """
+        for (reason, path), count in self._problems.items():
+            yield reason, path, count
+        for reason, count in self._overflow.items():
+            yield reason, None, count
+        if self.dropped:
+            yield (u'{0} other problem(s) are not detailed.'.format(
+                    self.dropped), None, self.dropped)
+
+    def getProblems(self, root):
+        """Return the problems as a list of (reason, content), looking
+        up their content from root.
+        """
+        result = []
+        for reason, path, count in self:
+            content = None
+            if path is not None:
+                content = root.unrestrictedTraverse(path, None)
+            result.append((reason, content))
+        return result
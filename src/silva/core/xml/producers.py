@@ -10,23 +10,46 @@ from Products.Silva.ExtensionRegistry import meta_types_for_interface
 
 from five import grok
 from zope.component import getUtility
+from zope.intid.interfaces import IIntIds
 from zope.traversing.browser import absoluteURL
 
 from silva.core.xml import NS_SILVA_CONTENT_URI, NS_SILVA_EXTRA_URI
 from silva.core.interfaces import IPublication, IPublishable, INonPublishable
-from silva.core.interfaces import IPublicationWorkflow
+from silva.core.interfaces import IPublicationWorkflow, IOrderManager
 from silva.core.interfaces import ISilvaXMLExportable, ISilvaXMLProducer
 from silva.core.interfaces.errors import ExternalReferenceError
-from silva.core.references.interfaces import IReferenceService
-from silva.core.references.reference import ReferenceSet
 from silva.core.references.utils import canonical_tuple_path, relative_tuple_path
 from silva.core.references.utils import is_inside_path
-from silva.core.services.interfaces import IMetadataService
 from silva.translations import translate as _
 from sprout.saxext import xmlexport
 
 
-class SilvaProducer(xmlexport.Producer):
+class SubProducer(object):
+    """Produce the XML of sub-objects: their producers are measured
+    if statistics are collected by the exporter, then the sub-objects
+    are released.
+    """
+
+    def subsax(self, context, **kw):
+        producer = self.configuration.getProducer(context)
+        statistics = self.getExtra().statistics
+        if statistics is None:
+            producer.sax(**kw)
+        else:
+            with statistics.measure(producer.__class__):
+                producer.sax(**kw)
+        self.subsaxDone(context)
+
+    def subsaxDone(self, context):
+        """Called once the XML of a sub-object is produced. Release it
+        from the ZODB cache if the release_objects option is set.
+        """
+        exported = self.getExtra()
+        if exported.release_objects:
+            exported.releaseObject(context)
+
+
+class SilvaProducer(SubProducer, xmlexport.Producer):
     grok.baseclass()
     grok.implements(ISilvaXMLProducer)
 
@@ -49,13 +72,12 @@ class SilvaProducer(xmlexport.Producer):
         """Return a path to refer an item that is contained inside the
         export root folder for a reference tagged name.
         """
-        service = getUtility(IReferenceService)
-        reference = service.get_reference(self.context, name=name)
+        exported = self.getExported()
+        reference = exported.referenceService.get_reference(
+            self.context, name=name)
         if reference is None:
             return None
-        exported = self.getExported()
         options = self.getOptions()
-        root = exported.root
         if not options.external_rendering:
             if not reference.target_id:
                 # The reference is broken. Return an empty path.
@@ -63,7 +85,9 @@ class SilvaProducer(xmlexport.Producer):
                     u'Content has a broken reference in the export.',
                     self.context)
                 return ""
-            if not reference.is_target_inside_container(root):
+            path = exported.getReferencePath(reference)
+            if path is None:
+                root = exported.root
                 if options.external_references:
                     # The reference is not inside the export, export
                     # anyway with a broken reference if the option is given.
@@ -77,37 +101,43 @@ class SilvaProducer(xmlexport.Producer):
                     raise ExternalReferenceError(
                         _(u"External references"),
                         self.context, reference.target, root)
-            # Add root path id as it is always mentioned in exports
-            return '/'.join(canonical_tuple_path(
-                    [root.getId()] + reference.relative_path_to(root)))
+            return path
         # Return url to the target
         return absoluteURL(reference.target, exported.request)
 
     def get_references(self, name):
-        ref_set = ReferenceSet(self.context, name)
         options = self.getOptions()
         exported = self.getExported()
+        have_broken = 0
         have_external = 0
-        root = exported.root
-        for reference in ref_set.get_references():
+        references = exported.referenceService.get_references_from(
+            self.context, name=unicode(name))
+        for reference in references:
             if not options.external_rendering:
                 if not reference.target_id:
                     # The reference is broken. Return an empty path.
+                    have_broken += 1
                     yield ""
-                if not reference.is_target_inside_container(root):
+                    continue
+                path = exported.getReferencePath(reference)
+                if path is None:
                     if options.external_references:
                         have_external += 1
                         continue
                     else:
                         raise ExternalReferenceError(
                             _(u"External references"),
-                            self.context, reference.target, root)
-                # Add root path id as it is always mentioned in exports
-                path = [root.getId()] + reference.relative_path_to(root)
-                yield '/'.join(canonical_tuple_path(path))
+                            self.context, reference.target, exported.root)
+                yield path
             else:
                 # Return url to the target
                 yield absoluteURL(reference.target, exported.request)
+        if have_broken:
+            exported.reportProblem(
+                (u'Content contains {0} broken reference(s) in the ' +
+                 u'export.').format(
+                    have_broken),
+                self.context)
         if have_external:
             # Report the collected problems.
             exported.reportProblem(
@@ -119,19 +149,16 @@ class SilvaProducer(xmlexport.Producer):
     def sax_metadata(self):
         """Export the item metadata.
         """
-        binding = getUtility(IMetadataService).getMetadata(self.context)
+        exported = self.getExported()
+        binding = exported.metadataService.getMetadata(self.context)
         if binding is None:
             return
+        schema = exported.getMetadataSchema(binding)
         # Don't acquire metadata only for the root of the xmlexport
-        acquire_metadata = int(self.getExported().root is self.context)
+        acquire_metadata = int(exported.root is self.context)
 
         self.startElement('metadata')
-        set_ids = binding.collection.keys()
-        set_ids.sort()
-
-        for set_id in set_ids:
-            set_obj = binding.collection[set_id]
-            prefix, namespace = set_obj.getNamespace()
+        for set_id, prefix, namespace, elements in schema.sets:
             if (namespace != NS_SILVA_CONTENT_URI and
                 namespace != NS_SILVA_EXTRA_URI):
                 self.handler.startPrefixMapping(prefix, namespace)
@@ -139,17 +166,54 @@ class SilvaProducer(xmlexport.Producer):
             items = binding._getData(set_id, acquire=acquire_metadata).items()
             items.sort()
             for key, value in items:
-                if not hasattr(aq_base(set_obj), key):
+                element = elements.get(key)
+                if element is None:
                     continue
-                field = binding.getElement(set_id, key).field
+                field, serialize = element
                 self.startElementNS(namespace, key)
                 if value is not None:
-                    field.validator.serializeValue(field, value, self)
+                    serialize(field, value, self)
                 self.endElementNS(namespace, key)
             self.endElement('set')
         self.endElement('metadata')
 
 
+class MetadataSchema(object):
+    """Metadata sets of a binding, with the fields and serializers of
+    their elements, computed once per export.
+    """
+
+    def __init__(self, binding):
+        self.sets = []
+        for set_id in sorted(binding.collection.keys()):
+            set_obj = binding.collection[set_id]
+            prefix, namespace = set_obj.getNamespace()
+            elements = {}
+            for element in set_obj.getElements():
+                field = element.field
+                elements[element.getId()] = (
+                    field, field.validator.serializeValue)
+            self.sets.append((set_id, prefix, namespace, elements))
+
+
+class ContentTypes(object):
+    """Meta types of the contents that can be exported from a
+    container, computed once per export.
+    """
+
+    def __init__(self):
+        self.publishables = frozenset(
+            meta_types_for_interface(IPublishable))
+        self.non_publishables = frozenset(
+            meta_types_for_interface(INonPublishable))
+        self.others = frozenset(
+            meta_types_for_interface(
+                ISilvaXMLExportable,
+                excepts=[IPublishable, INonPublishable]))
+        self.all = list(
+            self.publishables | self.non_publishables | self.others)
+
+
 class SilvaVersionedContentProducer(SilvaProducer):
     """Base Class for all versioned content
     """
@@ -260,27 +324,63 @@ class SilvaContainerProducer(SilvaProducer):
     """
     grok.baseclass()
 
+    def get_contents(self):
+        """Return the default, the ordered publishables, the
+        non-publishables and the other contents of the container,
+        listing its children only once.
+        """
+        types = self.getExtra().contentTypes
+        default = self.context.get_default()
+        publishables = []
+        non_publishables = []
+        others = []
+        for content in self.context.objectValues(types.all):
+            meta_type = content.meta_type
+            if meta_type in types.publishables:
+                if not content.is_default():
+                    publishables.append(content)
+            elif meta_type in types.non_publishables:
+                non_publishables.append(content)
+            else:
+                others.append(content)
+        if publishables:
+            # Looking up the position of each content in the order is
+            # quadratic on huge folders, use a table instead.
+            intids = getUtility(IIntIds)
+            order = IOrderManager(self.context).order
+            positions = dict(zip(order, range(len(order))))
+            publishables.sort(
+                key=lambda content: positions.get(
+                    intids.queryId(content), -1))
+        non_publishables.sort(key=lambda content: content.getId())
+        return default, publishables, non_publishables, others
+
     def sax_contents(self):
         options = self.getOptions()
         self.startElement('content')
         if not options.only_container:
-            default = self.context.get_default()
+            default, publishables, non_publishables, others = \
+                self.get_contents()
+            if not options.include_publications:
+                publishables = [
+                    content for content in publishables
+                    if not IPublication.providedBy(content)]
+            exported = self.getExtra()
+            # Sub-containers can be exported at the same time by workers.
+            fragments = exported.getFragments(self.context, publishables)
             if default is not None:
                 self.startElement('default')
                 self.subsax(default)
                 self.endElement('default')
-            for content in self.context.get_ordered_publishables():
-                if (IPublication.providedBy(content) and
-                    not options.include_publications):
-                    continue
-                self.subsax(content)
-            for content in self.context.get_non_publishables():
+            for content in publishables:
+                fragment = fragments.get(content.getId())
+                if (fragment is None or
+                    not exported.spliceFragment(self.handler, fragment)):
+                    self.subsax(content)
+            for content in non_publishables:
                 self.subsax(content)
             if options.other_contents:
-                meta_types = meta_types_for_interface(
-                    ISilvaXMLExportable,
-                    excepts=[IPublishable, INonPublishable])
-                for content in self.context.objectValues(meta_types):
+                for content in others:
                     self.subsax(content)
         self.endElement('content')
 
@@ -304,25 +404,35 @@ class ZexpProducer(SilvaProducer):
         self.endElement('unknown_content')
 
 
-class ExporterProducer(xmlexport.BaseProducer):
+class ExporterProducer(SubProducer, xmlexport.BaseProducer):
 
-    def get_relative_path_to(self, content):
+    def get_relative_path_to(self, path):
         exported = self.getExported()
         return '/'.join(canonical_tuple_path(
                 [exported.root.getId()] +
-                relative_tuple_path(
-                    exported.rootPath,
-                    content.getPhysicalPath())))
+                relative_tuple_path(exported.rootPath, path)))
 
     def sax(self):
         self.startElement(
             'silva',
             {'silva_version': self.context.getVersion()})
         self.subsax(self.context.root)
-        for problem, content in self.getExported().getProblems():
-            self.startElement(
-                'problem',
-                {'path': self.get_relative_path_to(content)})
+        for problem, path, count in self.getExported().problems:
+            attributes = {}
+            if path is not None:
+                attributes['path'] = self.get_relative_path_to(path)
+            if count > 1:
+                attributes['count'] = str(count)
+            self.startElement('problem', attributes)
             self.characters(problem)
             self.endElement('problem')
         self.endElement('silva')
+
+
+class FragmentProducer(SubProducer, xmlexport.BaseProducer):
+    """Export one content of an export, without the document around
+    it.
+    """
+
+    def sax(self):
+        self.subsax(self.context.fragment)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import contextlib
+import cProfile
+import timeit
+
+
+def statistics_name(key):
+    """Return the name under which statistics are reported for key.
+    """
+    if isinstance(key, type):
+        return '.'.join((key.__module__, key.__name__))
+    name = getattr(key, '__name__', None)
+    if name is not None:
+        return '.'.join((getattr(key, '__module__', None) or '?', name))
+    return str(key)
+
+
+class CountingStream(object):
+    """Wrap a writable stream, counting the bytes written to it.
+    """
+
+    def __init__(self, stream, statistics):
+        self._stream = stream
+        self._statistics = statistics
+
+    def write(self, data):
+        self._statistics.written += len(data)
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class Statistics(object):
+    """Collect call counts, cumulative and self time, and bytes
+    emitted, by producer, handler or action.
+    """
+
+    def __init__(self, profile=False):
+        self._entries = {}
+        self._stack = []
+        self.written = 0
+        self.profiler = None
+        if profile:
+            self.profiler = cProfile.Profile()
+
+    @classmethod
+    def create(cls, option):
+        """Create statistics for the given value of the statistics
+        option, or return None if they are disabled.
+        """
+        if not option:
+            return None
+        return cls(profile=option == 'profile')
+
+    def start(self, key, started=None):
+        if started is None:
+            started = timeit.default_timer()
+        self._stack.append([key, started, 0.0, self.written, 0])
+
+    def stop(self):
+        key, started, children, written, children_written = self._stack.pop()
+        elapsed = timeit.default_timer() - started
+        written = self.written - written
+        self.add(key, elapsed, elapsed - children, written - children_written)
+        if self._stack:
+            parent = self._stack[-1]
+            parent[2] += elapsed
+            parent[4] += written
+
+    def add(self, key, cumulative, own=None, written=0):
+        """Record a call to key. Calls to keys reported under the
+        same name, like bound methods or closures, are added together.
+        """
+        name = statistics_name(key)
+        entry = self._entries.get(name)
+        if entry is None:
+            entry = self._entries[name] = [0, 0.0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += cumulative
+        entry[2] += cumulative if own is None else own
+        entry[3] += written
+
+    @contextlib.contextmanager
+    def measure(self, key):
+        self.start(key)
+        try:
+            yield
+        finally:
+            self.stop()
+
+    @contextlib.contextmanager
+    def profile(self):
+        if self.profiler is None:
+            yield
+        else:
+            self.profiler.enable()
+            try:
+                yield
+            finally:
+                self.profiler.disable()
+
+    def count(self, stream):
+        """Return a stream counting the bytes written to stream.
+        """
+        return CountingStream(stream, self)
+
+    def getStatistics(self):
+        result = {}
+        for name, (calls, cumulative, own, written) in self._entries.items():
+            result[name] = {
+                'calls': calls,
+                'cumulative': cumulative,
+                'self': own,
+                'bytes': written}
+        return result
+
+
+class StatisticsHandler(object):
+    """SAX handler measuring the time spent in each import handler,
+    from its creation until it is discarded, before sending the events
+    to output.
+
+    Import handlers are read from the stack of the sprout import
+    handler.
+    """
+
+    def __init__(self, output, handler, statistics):
+        self._output = output
+        self._stack = handler._handler_stack
+        self._statistics = statistics
+
+    def startElementNS(self, name, qname, attrs):
+        started = timeit.default_timer()
+        depth = len(self._stack)
+        self._output.startElementNS(name, qname, attrs)
+        if len(self._stack) > depth:
+            self._statistics.start(self._stack[-1].__class__, started)
+
+    def endElementNS(self, name, qname):
+        depth = len(self._stack)
+        self._output.endElementNS(name, qname)
+        if len(self._stack) < depth:
+            self._statistics.stop()
+
+    def __getattr__(self, name):
+        return getattr(self._output, name)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import logging
+
+
+class LogRecorder(logging.Handler):
+    """Record the messages logged by silva.core.xml.
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+    def __enter__(self):
+        logger = logging.getLogger('silva.core.xml')
+        self.level = logger.level
+        logger.setLevel(logging.INFO)
+        logger.addHandler(self)
+        return self.messages
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        logger = logging.getLogger('silva.core.xml')
+        logger.removeHandler(self)
+        logger.setLevel(self.level)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Importer
+from silva.core.xml.xmlimport import RESOLVE_PHASE, REFERENCE_PHASE
+from silva.core.xml.xmlimport import NOTIFY_PHASE, ContentMethod
+
+
+class ImporterActionsTestCase(unittest.TestCase):
+    """Test the actions run at the end of an import.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('folder', 'Folder')
+        factory.manage_addFolder('imported', 'Imported')
+        self.importer = Importer(self.root, TestRequest())
+        self.runs = []
+
+    def batch(self, items):
+        self.runs.append(('batch', list(items)))
+
+    def test_phases(self):
+        """Actions are run phase by phase, in the order they were
+        added. Items of a batch action are given at once.
+        """
+        importer = self.importer
+        importer.addAction(self.runs.append, ['notify'], NOTIFY_PHASE)
+        importer.addAction(self.runs.append, ['reference'])
+        importer.addBatchAction(self.batch, 1, RESOLVE_PHASE)
+        importer.addAction(self.runs.append, ['resolve'], RESOLVE_PHASE)
+        importer.addBatchAction(self.batch, 2, RESOLVE_PHASE)
+        importer.addAction(self.runs.append, ['reference2'], REFERENCE_PHASE)
+        importer.runActions()
+        self.assertEqual(
+            self.runs,
+            [('batch', [1, 2]), 'resolve', 'reference', 'reference2',
+             'notify'])
+
+        # Actions are cleared once run.
+        del self.runs[:]
+        importer.runActions()
+        self.assertEqual(self.runs, [])
+
+    def test_keep(self):
+        importer = self.importer
+        importer.addAction(self.runs.append, ['reference'])
+        importer.addAction(self.runs.append, ['resolve'], RESOLVE_PHASE)
+        importer.runActions(clear=False)
+        importer.runActions()
+        self.assertEqual(
+            self.runs, ['resolve', 'reference', 'resolve', 'reference'])
+
+    def test_add_from_action(self):
+        """Actions added by an action are run, even in an earlier
+        phase. The earliest phase is run first.
+        """
+        importer = self.importer
+
+        def reference():
+            self.runs.append('reference')
+            importer.addBatchAction(self.batch, 1, RESOLVE_PHASE)
+            importer.addAction(self.runs.append, ['reference2'])
+
+        def notify():
+            self.runs.append('notify')
+            importer.addAction(self.runs.append, ['reference3'])
+            importer.addAction(self.runs.append, ['notify2'], NOTIFY_PHASE)
+
+        importer.addAction(notify, [], NOTIFY_PHASE)
+        importer.addAction(reference, [])
+        importer.addAction(self.runs.append, ['reference1'])
+        importer.runActions()
+        self.assertEqual(
+            self.runs,
+            ['reference', 'reference1', ('batch', [1]), 'reference2',
+             'notify', 'reference3', 'notify2'])
+
+    def test_resolve_from_action(self):
+        """Imported paths can be resolved by a reference action. Their
+        targets are set before the other reference actions.
+        """
+        importer = self.importer
+        importer.addImportedPath(['folder'], ['imported'])
+
+        def reference():
+            importer.resolveImportedPath(
+                self.root.folder, self.runs.append, 'folder')
+            importer.addAction(self.runs.append, ['reference'])
+
+        importer.addAction(reference, [])
+        importer.addAction(self.runs.append, ['notify'], NOTIFY_PHASE)
+        importer.runActions()
+        self.assertEqual(
+            self.runs, [self.root.imported, 'reference', 'notify'])
+        self.assertEqual(importer.getProblems(), [])
+
+    def test_content_method(self):
+        """Methods of a content are kept as the path of the content and
+        the name of the method.
+        """
+        folder = self.root.folder
+        method = ContentMethod.create(folder.set_title)
+        self.assertTrue(isinstance(method, ContentMethod))
+        self.assertEqual(method.path, folder.getPhysicalPath())
+        self.assertEqual(method.name, 'set_title')
+        self.assertEqual(method.resolve(self.root), folder.set_title)
+        # Other callables are kept as they are.
+        for method in (self.runs.append, self.batch, lambda target: None):
+            self.assertIs(ContentMethod.create(method), method)
+
+    def test_content_method_actions(self):
+        """Actions and setters that are methods of a content are run on
+        the content found at its path.
+        """
+        importer = self.importer
+        importer.addAction(self.root.folder.set_title, [u'Changed'])
+        importer.resolveImportedPath(
+            self.root.imported, self.root.imported.set_title, 'root:folder')
+        self.root.manage_delObjects(['imported'])
+        importer.runActions()
+        self.assertEqual(self.root.folder.get_title(), u'Changed')
+        self.assertEqual(
+            importer.getProblems(),
+            [("Imported content /root/imported is not found.", None)])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ImporterActionsTestCase))
+    return suite
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import transaction
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Exporter, Importer
+from silva.core.xml.checkpoint import Checkpoint, CheckpointHandler
+
+
+class Output(object):
+    """Record the elements it receives. Like handlers, complete the
+    checkpoint at the end of the content elements, and queue actions
+    for some of them.
+    """
+
+    def __init__(self, checkpoint, contents=(), queuing=()):
+        self.checkpoint = checkpoint
+        self.contents = contents
+        self.queuing = queuing
+        self.elements = []
+
+    def startElementNS(self, name, qname, attrs):
+        self.elements.append(name[1])
+        if name[1] in self.queuing:
+            self.checkpoint.queued()
+
+    def endElementNS(self, name, qname):
+        if name[1] in self.contents:
+            self.checkpoint.complete()
+
+    def characters(self, content):
+        self.elements.append(content)
+
+
+class CheckpointTestCase(unittest.TestCase):
+    """Test the ranges of imported elements that are skipped when an
+    import is resumed.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parse(self, checkpoint, elements, **options):
+        """Send the given tree of elements, numbered in document
+        order, through a CheckpointHandler.
+        """
+        output = Output(checkpoint, **options)
+        handler = CheckpointHandler(output, checkpoint)
+
+        def send(name, children):
+            handler.startElementNS((None, name), name, {})
+            handler.characters(name.upper())
+            for child in children:
+                send(*child)
+            handler.endElementNS((None, name), name)
+
+        send(*elements)
+        return output.elements
+
+    # root (0), a (1), a1 (2), b (3), b1 (4), c (5)
+    document = ('root', [('a', [('a1', [])]), ('b', [('b1', [])]), ('c', [])])
+
+    def test_ranges(self):
+        """Completed contents are kept as ranges, that contain the
+        ranges of their contents. Adjacent ranges are merged.
+        """
+        checkpoint = Checkpoint(self.filename)
+        self.parse(checkpoint, self.document, contents=('a1', 'a', 'b1'))
+        self.assertEqual(checkpoint.ranges, [(1, 3), (4, 5)])
+        self.assertEqual(checkpoint.offset, 6)
+
+        checkpoint = Checkpoint(self.filename)
+        self.parse(checkpoint, self.document, contents=('a1', 'a', 'b', 'c'))
+        self.assertEqual(checkpoint.ranges, [(1, 6)])
+
+    def test_queued(self):
+        """Contents that queued actions, or whose contents did, are not
+        kept: their actions would be lost.
+        """
+        checkpoint = Checkpoint(self.filename)
+        self.parse(
+            checkpoint, self.document,
+            contents=('a1', 'a', 'b1', 'b', 'c', 'root'), queuing=('b1',))
+        self.assertEqual(checkpoint.ranges, [(1, 3), (5, 6)])
+
+    def test_resume(self):
+        """Saved ranges are skipped when the import is resumed, and
+        kept for the next checkpoint.
+        """
+        checkpoint = Checkpoint(self.filename)
+        self.assertEqual(checkpoint.load(), None)
+        self.parse(checkpoint, self.document, contents=('a1', 'a', 'c'))
+        checkpoint.save({'root': ('', 'root')})
+
+        checkpoint = Checkpoint(self.filename)
+        state = checkpoint.load()
+        self.assertEqual(state['ranges'], [(1, 3), (5, 6)])
+        self.assertEqual(state['root'], ('', 'root'))
+        elements = self.parse(checkpoint, self.document, contents=('b1',))
+        self.assertEqual(
+            elements, ['root', 'ROOT', 'b', 'B', 'b1', 'B1'])
+        self.assertEqual(checkpoint.ranges, [(1, 3), (4, 6)])
+
+        checkpoint.remove()
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(Checkpoint(self.filename).load(), None)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedImporter(Importer):
+    """Stop the import after a number of commits.
+    """
+    interrupt = 3
+
+    def commit(self):
+        super(InterruptedImporter, self).commit()
+        if self.commits == self.interrupt:
+            raise Interrupted()
+
+
+class ImporterCheckpointTestCase(unittest.TestCase):
+    """Test an import that is interrupted, then resumed.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'checkpoint')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('folder', 'Folder')
+        factory.manage_addFolder('imported', 'Imported')
+        factory = self.root.folder.manage_addProduct['Silva']
+        for index in range(4):
+            factory.manage_addFolder('sub%d' % index, 'Sub')
+            sub = getattr(self.root.folder, 'sub%d' % index)
+            sub.manage_addProduct['Silva'].manage_addFolder('data', 'Data')
+        transaction.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        """The resumed import updates the partly imported content,
+        even if replacing content was asked.
+        """
+        exporter = Exporter(self.root.folder, TestRequest(), {})
+        data = exporter.getString()
+        options = {
+            'checkpoint': self.filename,
+            'checkpoint_objects': 1,
+            'replace_content': True}
+
+        importer = InterruptedImporter(
+            self.root.imported, TestRequest(), dict(options))
+        self.assertRaises(Interrupted, importer.importStream, io.BytesIO(data))
+        transaction.abort()
+        self.assertTrue(os.path.exists(self.filename))
+        # Part of the content is committed.
+        self.assertEqual(self.root.imported.objectIds(), ['folder'])
+
+        importer = Importer(self.root.imported, TestRequest(), dict(options))
+        importer.importStream(io.BytesIO(data))
+        self.assertEqual(importer.getProblems(), [])
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertFalse(importer.options['replace_content'])
+        imported = self.root.imported
+        self.assertEqual(imported.objectIds(), ['folder'])
+        self.assertEqual(
+            imported.folder.objectIds(), ['sub0', 'sub1', 'sub2', 'sub3'])
+        for index in range(4):
+            sub = getattr(imported.folder, 'sub%d' % index)
+            self.assertEqual(sub.objectIds(), ['data'])
+
+    def test_explicit(self):
+        """The transaction is only committed if checkpoint_objects is
+        set. Savepoints don't commit it.
+        """
+        self.assertRaises(
+            ValueError, Importer, self.root.imported, TestRequest(),
+            {'checkpoint': self.filename, 'savepoint_objects': 1})
+
+        data = Exporter(self.root.folder, TestRequest(), {}).getString()
+        importer = Importer(self.root.imported, TestRequest(), {
+                'checkpoint': self.filename,
+                'checkpoint_objects': 4,
+                'savepoint_objects': 1})
+        importer.importStream(io.BytesIO(data))
+        self.assertEqual(importer.getProblems(), [])
+        self.assertTrue(importer.commits > 0)
+        self.assertTrue(importer.savepoints > importer.commits)
+        # The end of the import is committed as well.
+        self.assertFalse(self.root.imported._p_changed)
+        self.assertEqual(self.root.imported.objectIds(), ['folder'])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(CheckpointTestCase))
+    suite.addTest(unittest.makeSuite(ImporterCheckpointTestCase))
+    return suite
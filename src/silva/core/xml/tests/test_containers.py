@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+from xml.etree import ElementTree
+
+from Acquisition import aq_base
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+from silva.core.interfaces import IOrderManager
+
+from silva.core.xml import Exporter, NS_SILVA_URI
+
+
+def silva_tag(name):
+    return '{%s}%s' % (NS_SILVA_URI, name)
+
+
+class ContainerContentsTestCase(unittest.TestCase):
+    """Test the order in which the contents of a container are
+    exported.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('author')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('folder', 'Folder')
+        self.folder = self.root.folder
+        factory = self.folder.manage_addProduct['Silva']
+        factory.manage_addAutoTOC('index', 'Index')
+        factory.manage_addFolder('beta', 'Beta')
+        factory.manage_addPublication('publication', 'Publication')
+        factory.manage_addAutoTOC('toc', 'Table of contents')
+        factory.manage_addFolder('alpha', 'Alpha')
+        for identifier in ['notes', 'data']:
+            with self.layer.open_fixture('test_file_text.txt') as text:
+                factory.manage_addFile(identifier, identifier.title(), text)
+        IOrderManager(self.folder).move(self.folder.alpha, 0)
+
+        # Count how many times the children of the folder are listed.
+        self.listed = []
+        folder = aq_base(self.folder)
+        objectValues = self.folder.objectValues
+
+        def count(*args):
+            self.listed.append(args)
+            return objectValues(*args)
+
+        folder.objectValues = count
+
+    def export(self, **options):
+        data = Exporter(self.folder, TestRequest(), options).getString()
+        content = ElementTree.fromstring(data).find(
+            '/'.join([silva_tag('folder'), silva_tag('content')]))
+        identifiers = []
+        for element in content:
+            if element.tag == silva_tag('default'):
+                element = element[0]
+            identifiers.append(element.get('id'))
+        return identifiers
+
+    def test_order(self):
+        """The default comes first, then the publishables in the order
+        of the folder and the non-publishables sorted by identifier,
+        listing the children of the folder once.
+        """
+        expected = (
+            ['index'] +
+            [c.getId() for c in self.folder.get_ordered_publishables()] +
+            [c.getId() for c in self.folder.get_non_publishables()])
+        del self.listed[:]
+        identifiers = self.export()
+        self.assertEqual(identifiers, expected)
+        self.assertEqual(
+            identifiers,
+            ['index', 'alpha', 'beta', 'publication', 'toc', 'data',
+             'notes'])
+        self.assertEqual(len(self.listed), 1)
+
+    def test_options(self):
+        self.assertEqual(
+            self.export(include_publications=False),
+            ['index', 'alpha', 'beta', 'toc', 'data', 'notes'])
+        self.assertEqual(self.export(only_container=True), [])
+        self.assertEqual(len(self.listed), 1)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ContainerContentsTestCase))
+    return suite
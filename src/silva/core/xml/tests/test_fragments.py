@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import transaction
+from Testing.makerequest import makerequest
+from ZODB import DB
+from ZODB.DemoStorage import DemoStorage
+from ZODB.FileStorage import FileStorage
+from zope.component.hooks import setSite
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Exporter, Importer
+from silva.core.xml.tests.helpers import LogRecorder
+from silva.core.xml.xmlexport import SplicingGenerator
+
+
+class BrokenDatabase(object):
+
+    def open(self):
+        raise RuntimeError('Cannot open the database')
+
+
+def broken_database():
+    return BrokenDatabase()
+
+
+def failing_database():
+    raise RuntimeError('Cannot start the worker')
+
+
+def slow_database():
+    time.sleep(60)
+
+
+def add_contents(root):
+    factory = root.manage_addProduct['Silva']
+    factory.manage_addFolder('folder', u'Folder')
+    factory.manage_addFolder('imported', u'Imported')
+    factory = root.folder.manage_addProduct['Silva']
+    for index in range(4):
+        factory.manage_addFolder('sub%d' % index, u'Caf\xe9 %d' % index)
+        sub = getattr(root.folder, 'sub%d' % index)
+        sub.manage_addProduct['Silva'].manage_addFolder(
+            'data', u'Donn\xe9es <&>')
+    transaction.commit()
+
+
+def failure(error):
+    return (u'Worker processes failed to export content ({0}), '
+            u'it is exported without them.'.format(error))
+
+
+class SplicingGeneratorTestCase(unittest.TestCase):
+    """Test inserting XML in the output of a generator.
+    """
+
+    def test_splice(self):
+        output = io.BytesIO()
+        generator = SplicingGenerator(output, 'utf-8')
+        generator.startPrefixMapping(None, 'urn:test')
+        generator.startElementNS(('urn:test', 'content'), None, {})
+        generator.characters(u'<&>')
+        generator.startElementNS(('urn:test', 'fragment'), None, {})
+        # The start tag is finished before the XML is inserted.
+        generator.splice(io.BytesIO(u'<data>Caf\xe9 &amp;</data>'.encode(
+                    'utf-8')), chunk_size=4)
+        generator.endElementNS(('urn:test', 'fragment'), None)
+        generator.endElementNS(('urn:test', 'content'), None)
+        generator.endPrefixMapping(None)
+        self.assertEqual(
+            output.getvalue(),
+            u'<content xmlns="urn:test">&lt;&amp;&gt;<fragment>'
+            u'<data>Caf\xe9 &amp;</data></fragment></content>'.encode(
+                'utf-8'))
+
+
+class FragmentsTestCase(unittest.TestCase):
+    """Test the export of the containers of the export root by worker
+    processes, and the import of the result.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+        add_contents(self.root)
+
+    def export(self, **options):
+        options.setdefault('fragment_workers', 2)
+        options.setdefault('fragment_database', self.root._p_jar.db)
+        exporter = Exporter(self.root.folder, TestRequest(), options)
+        return exporter, exporter.getString()
+
+    def assertImported(self, exporter, data):
+        # The problems of the export are imported as well.
+        problems = [reason for reason, content in exporter.getProblems()]
+        importer = Importer(self.root.imported, TestRequest(), {})
+        importer.importStream(io.BytesIO(data))
+        self.assertEqual(
+            [reason for reason, content in importer.getProblems()], problems)
+        folder = self.root.imported.folder
+        self.assertEqual(
+            folder.objectIds(), ['sub0', 'sub1', 'sub2', 'sub3'])
+        for index in range(4):
+            sub = getattr(folder, 'sub%d' % index)
+            self.assertEqual(sub.get_title(), u'Caf\xe9 %d' % index)
+            self.assertEqual(sub.objectIds(), ['data'])
+            self.assertEqual(sub.data.get_title(), u'Donn\xe9es <&>')
+
+    def assertProblems(self, exporter, problems):
+        self.assertEqual(
+            [reason for reason, content in exporter.getProblems()], problems)
+
+    def test_fragments(self):
+        exporter, data = self.export()
+        self.assertProblems(exporter, [])
+        self.assertImported(exporter, data)
+        # Fragments are inserted as they are exported.
+        expected, expected_data = self.export(fragment_workers=0)
+        self.assertEqual(data, expected_data)
+
+    def test_encoding(self):
+        """Fragments are spliced with the encoding of the export.
+        """
+        exporter, data = self.export(encoding='latin-1')
+        self.assertProblems(exporter, [])
+        self.assertIn(u'Caf\xe9 3'.encode('latin-1'), data)
+        self.assertImported(exporter, data)
+
+    def test_worker_failure(self):
+        """If the worker processes fail, the content is exported
+        without them and a problem is reported.
+        """
+        exporter, data = self.export(fragment_database=broken_database)
+        self.assertProblems(exporter, [failure('RuntimeError')])
+        self.assertImported(exporter, data)
+
+        exporter, data = self.export(fragment_database=failing_database)
+        self.assertProblems(exporter, [failure('RuntimeError')])
+
+    def test_timeout(self):
+        """Workers that don't export their fragment don't block the
+        export.
+        """
+        exporter, data = self.export(
+            fragment_database=slow_database, fragment_timeout=1)
+        self.assertProblems(exporter, [failure('TimeoutError')])
+        self.assertImported(exporter, data)
+
+    def test_uncommitted(self):
+        """Content changed in the transaction is exported without the
+        worker processes, that would not see the changes.
+        """
+        self.root.folder.sub3.set_title(u'Changed')
+        with LogRecorder() as messages:
+            exporter, data = self.export()
+        self.assertEqual(
+            messages,
+            [u'Content is exported without worker processes: '
+             u'the transaction has uncommitted changes.'])
+        self.assertProblems(exporter, [])
+        self.assertIn(b'Changed', data)
+
+    def test_threads(self):
+        """Worker processes are not forked while other threads run.
+        """
+        event = threading.Event()
+        thread = threading.Thread(target=event.wait)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(event.set)
+        with LogRecorder() as messages:
+            exporter, data = self.export()
+        self.assertEqual(
+            messages,
+            [u'Content is exported without worker processes: '
+             u'other threads are running.'])
+        self.assertProblems(exporter, [])
+        self.assertImported(exporter, data)
+
+
+class FileStorageFragmentsTestCase(unittest.TestCase):
+    """Test worker processes exporting content stored in a
+    FileStorage, that the export process uses as well.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.layer.login('editor')
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'Data.fs')
+        # The Silva root of the test is in the base storage, the
+        # content is stored in the FileStorage.
+        self.base = self.layer.get_application()._p_jar.db().storage
+        self.database = self.open_database(read_only=False, create=True)
+        self.connection = self.database.open()
+        application = makerequest(self.connection.root()['Application'])
+        self.root = application.root
+        setSite(self.root)
+        add_contents(self.root)
+
+    def tearDown(self):
+        transaction.abort()
+        setSite(self.layer.get_application())
+        self.connection.close()
+        self.database.close()
+        shutil.rmtree(self.directory)
+
+    def open_database(self, read_only=True, create=False):
+        return DB(DemoStorage(
+                base=self.base,
+                changes=FileStorage(
+                    self.filename, create=create, read_only=read_only),
+                close_base_on_close=False))
+
+    def export(self, **options):
+        exporter = Exporter(self.root.folder, TestRequest(), options)
+        return exporter, exporter.getString()
+
+    def test_read_only(self):
+        exporter, data = self.export(
+            fragment_workers=2, fragment_database=self.open_database)
+        self.assertEqual(exporter.getProblems(), [])
+        expected, expected_data = self.export()
+        self.assertEqual(data, expected_data)
+
+    def test_read_write(self):
+        """The FileStorage is locked by the export process.
+        """
+        exporter, data = self.export(
+            fragment_workers=2,
+            fragment_database=lambda: self.open_database(read_only=False))
+        self.assertEqual(
+            [reason for reason, content in exporter.getProblems()],
+            [failure('LockError')])
+        self.assertIn(b'<folder id="sub3">', data)
+
+    def test_shared(self):
+        """The database of the export process can't be used by the
+        worker processes.
+        """
+        exporter, data = self.export(
+            fragment_workers=2, fragment_database=lambda: self.database)
+        self.assertEqual(
+            [reason for reason, content in exporter.getProblems()],
+            [failure('ValueError')])
+        self.assertIn(b'<folder id="sub3">', data)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(SplicingGeneratorTestCase))
+    suite.addTest(unittest.makeSuite(FragmentsTestCase))
+    suite.addTest(unittest.makeSuite(FileStorageFragmentsTestCase))
+    return suite
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from sprout.saxext import xmlimport
+
+from silva.core.xml import NS_SILVA_URI, handlers
+from silva.core.xml.defaulthandlers import VersionHandler
+
+NS_TEST_URI = 'urn:test'
+
+
+class OwnerHandler(handlers.RegisteredHandler):
+    """Override status and reference elements, and record the data
+    they set.
+    """
+
+    def getOverrides(self):
+        return {
+            (NS_TEST_URI, 'status'):
+                self.handlerFactories.contentHandler('status'),
+            (NS_TEST_URI, 'reference'):
+                self.handlerFactories.tagHandler('reference', NS_TEST_URI)}
+
+    def endElementNS(self, name, qname):
+        if name == (NS_TEST_URI, 'owner'):
+            self.getExtra().append(
+                ('owner', self.getData('status'), self.getData('reference')))
+
+
+class ItemHandler(handlers.RegisteredHandler):
+    """Handler of an element between the owner and the overridden
+    elements.
+    """
+
+    def endElementNS(self, name, qname):
+        if name == (NS_TEST_URI, 'item'):
+            self.getExtra().append(
+                ('item', self.getData('status'), self.getData('reference')))
+
+
+class WorkflowHandler(handlers.RegisteredHandler):
+    """Record the versions set by version handlers.
+    """
+
+    def setWorkflowVersion(self, version_id, publication, expiration,
+                           status):
+        self.getExtra().append(
+            ('version', version_id, publication, expiration, status))
+
+
+class DynamicHandlersTestCase(unittest.TestCase):
+    """Test the handlers created by handlerFactories.
+    """
+
+    def parse(self, xml):
+        importer = xmlimport.Importer()
+        importer.registerHandler((NS_TEST_URI, 'owner'), OwnerHandler)
+        importer.registerHandler((NS_TEST_URI, 'item'), ItemHandler)
+        importer.registerHandler((NS_TEST_URI, 'workflow'), WorkflowHandler)
+        importer.registerHandler((NS_SILVA_URI, 'version'), VersionHandler)
+        recorded = []
+        importer.importFromString(xml, extra=recorded)
+        return recorded
+
+    def test_cached(self):
+        """Handlers are created once by parameters.
+        """
+        factories = handlers.handlerFactories
+        self.assertIs(
+            factories.contentHandler('status'),
+            factories.contentHandler('status'))
+        self.assertIsNot(
+            factories.contentHandler('status'),
+            factories.contentHandler('title'))
+        self.assertIs(
+            factories.tagHandler('reference', NS_TEST_URI),
+            factories.tagHandler('reference', NS_TEST_URI))
+        self.assertIsNot(
+            factories.tagHandler('reference', NS_TEST_URI),
+            factories.tagHandler('reference'))
+
+    def test_owner(self):
+        self.assertEqual(
+            self.parse(
+                b'<owner xmlns="urn:test"><status> closed </status>'
+                b'<reference id="target" /></owner>'),
+            [('owner', u'closed', u'target')])
+
+    def test_nested(self):
+        """Data is set on the handler overriding the elements, not on
+        the handlers between them.
+        """
+        self.assertEqual(
+            self.parse(
+                b'<owner xmlns="urn:test"><item><status>closed</status>'
+                b'<reference id="target" /></item></owner>'),
+            [('item', None, None), ('owner', u'closed', u'target')])
+
+    def test_overrides(self):
+        """Handlers with static overrides share them, and the data of
+        the overridden elements is set on them.
+        """
+        self.assertIs(
+            VersionHandler(None, None).getOverrides(),
+            VersionHandler(None, None).getOverrides())
+        self.assertEqual(
+            self.parse(
+                (u'<workflow xmlns="urn:test" xmlns:silva="%s">'
+                 u'<silva:version id="0"><silva:status>public</silva:status>'
+                 u'<silva:publication_datetime>2013/05/23'
+                 u'</silva:publication_datetime></silva:version></workflow>'
+                 % NS_SILVA_URI).encode('utf-8')),
+            [('version', u'0', u'2013/05/23', None, u'public')])
+
+
+class Container(object):
+    """Container of the imported content, where every identifier
+    exists.
+    """
+
+    def _getOb(self, identifier):
+        return identifier
+
+
+class PathHandler(handlers.Handler):
+    """Handler counting the lookups of its parent handler.
+    """
+    lookups = 0
+
+    def parentHandler(self):
+        self.lookups += 1
+        return handlers.Handler.parentHandler(self)
+
+
+class HandlerPathsTestCase(unittest.TestCase):
+    """Test the physical paths of the handlers of imported content.
+    """
+
+    def setUp(self):
+        container = Container()
+        self.root = PathHandler(container, None)
+        self.folder = PathHandler(container, self.root)
+        self.folder.setResultId('folder')
+        self.document = PathHandler(container, self.folder)
+        self.document.setResultId('import_of_document')
+        self.document.setOriginalId('document')
+
+    def test_paths(self):
+        self.assertEqual(self.root.getResultPhysicalPath(), ())
+        self.assertEqual(
+            self.document.getResultPhysicalPath(),
+            ('folder', 'import_of_document'))
+        # The result identifier is the original one if none is set.
+        self.assertEqual(
+            self.document.getOriginalPhysicalPath(), ('folder', 'document'))
+
+    def test_cached(self):
+        """Paths are computed once, extending the path of the parent
+        handler.
+        """
+        path = self.document.getResultPhysicalPath()
+        self.assertIs(self.document.getResultPhysicalPath(), path)
+        self.assertEqual(self.document.lookups, 1)
+        self.assertEqual(self.folder.lookups, 1)
+        self.document.getOriginalPhysicalPath()
+        self.document.getOriginalPhysicalPath()
+        self.assertEqual(self.document.lookups, 2)
+        self.assertEqual(self.folder.lookups, 2)
+
+    def test_changed(self):
+        """Paths are computed again when the identifiers change.
+        """
+        self.document.getResultPhysicalPath()
+        self.document.getOriginalPhysicalPath()
+        self.document.setResultId('document')
+        self.assertEqual(
+            self.document.getResultPhysicalPath(), ('folder', 'document'))
+        self.document.setOriginalId('other')
+        self.assertEqual(
+            self.document.getOriginalPhysicalPath(), ('folder', 'other'))
+        self.assertEqual(
+            self.document.getResultPhysicalPath(), ('folder', 'document'))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(DynamicHandlersTestCase))
+    suite.addTest(unittest.makeSuite(HandlerPathsTestCase))
+    return suite
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Importer
+
+
+class ImporterIdentifiersTestCase(unittest.TestCase):
+    """Test the identifiers index of the importer.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('folder', 'Folder')
+        factory = self.root.folder.manage_addProduct['Silva']
+        factory.manage_addFolder('data', 'Data')
+        factory.manage_addFolder('import_of_data', 'Data')
+
+    def test_identifiers(self):
+        """Identifiers are read once from the container, then kept up
+        to date by the importer.
+        """
+        folder = self.root.folder
+        importer = Importer(self.root, TestRequest())
+        identifiers = importer.getIdentifiers(folder)
+        self.assertEqual(identifiers, set(folder.objectIds()))
+        self.assertIn('data', identifiers)
+
+        importer.addIdentifier(folder, 'new')
+        self.assertIs(importer.getIdentifiers(folder), identifiers)
+        self.assertIn('new', importer.getIdentifiers(folder))
+        self.assertNotIn('new', folder.objectIds())
+
+        importer.removeIdentifier(folder, 'new')
+        importer.removeIdentifier(folder, 'missing')
+        self.assertNotIn('new', importer.getIdentifiers(folder))
+
+        # Containers are indexed separately.
+        self.assertEqual(
+            importer.getIdentifiers(folder.data),
+            set(folder.data.objectIds()))
+
+    def test_unique_identifier(self):
+        """Unique identifiers are computed like before, without
+        probing the suffixes already given.
+        """
+        folder = self.root.folder
+        importer = Importer(self.root, TestRequest())
+        self.assertEqual(
+            importer.getUniqueIdentifier(folder, 'other'), 'other')
+        self.assertEqual(
+            importer.getUniqueIdentifier(folder, 'data'), 'import2_of_data')
+        importer.addIdentifier(folder, 'import2_of_data')
+        self.assertEqual(
+            importer.getUniqueIdentifier(folder, 'data'), 'import3_of_data')
+        importer.addIdentifier(folder, 'import3_of_data')
+
+        # Identifiers added by the importer are taken into account.
+        importer.addIdentifier(folder, 'other')
+        self.assertEqual(
+            importer.getUniqueIdentifier(folder, 'other'), 'import_of_other')
+
+    def test_added_outside(self):
+        """Content added outside of the importer after its identifiers
+        are computed is not given an identifier already used.
+        """
+        folder = self.root.folder
+        importer = Importer(self.root, TestRequest())
+        identifiers = importer.getIdentifiers(folder)
+        factory = folder.manage_addProduct['Silva']
+        factory.manage_addFolder('other', 'Other')
+        factory.manage_addFolder('import2_of_data', 'Data')
+        self.assertNotIn('other', identifiers)
+
+        self.assertTrue(importer.hasIdentifier(folder, 'other'))
+        self.assertIn('other', importer.getIdentifiers(folder))
+        self.assertFalse(importer.hasIdentifier(folder, 'missing'))
+        self.assertEqual(
+            importer.getUniqueIdentifier(folder, 'other'), 'import_of_other')
+        self.assertEqual(
+            importer.getUniqueIdentifier(folder, 'data'), 'import3_of_data')
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ImporterIdentifiersTestCase))
+    return suite
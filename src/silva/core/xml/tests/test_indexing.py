@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.services.catalog import CatalogingTask
+from silva.core.xml import Importer
+from silva.core.xml.indexing import DeferredIndexing
+from silva.core.xml.tests.helpers import LogRecorder
+
+
+class DeferredIndexingTestCase(unittest.TestCase):
+    """Test the cataloging of imported content in batches.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+
+    def add_folders(self, count):
+        factory = self.root.manage_addProduct['Silva']
+        for index in range(count):
+            factory.manage_addFolder('folder%d' % index, 'Folder')
+
+    def test_batches(self):
+        indexing = DeferredIndexing(2)
+        indexing.start()
+        self.add_folders(5)
+        self.assertEqual(len(indexing), 5)
+        with LogRecorder() as messages:
+            self.assertEqual(indexing.flush(), 5)
+        self.assertEqual(
+            messages,
+            [u'Cataloged 2 of 5 imported contents.',
+             u'Cataloged 4 of 5 imported contents.',
+             u'Cataloged 5 of 5 imported contents.'])
+        self.assertEqual(len(indexing), 0)
+        self.assertEqual(indexing.flush(), 0)
+
+    def test_importer(self):
+        """Content is cataloged after the actions of the importer.
+        """
+        importer = Importer(
+            self.root, TestRequest(),
+            {'defer_indexing': True, 'indexing_batch_size': 3})
+        importer.indexing.start()
+        self.add_folders(4)
+        self.assertEqual(len(importer.indexing), 4)
+        with LogRecorder() as messages:
+            importer.runActions()
+        self.assertEqual(
+            messages,
+            [u'Cataloged 3 of 4 imported contents.',
+             u'Cataloged 4 of 4 imported contents.'])
+
+    def test_active(self):
+        """Content is cataloged at the end of the transaction if the
+        task already collects it.
+        """
+        task = CatalogingTask.get()
+        task.activate()
+        indexing = DeferredIndexing(2)
+        indexing.start()
+        self.add_folders(2)
+        self.assertEqual(len(indexing), 0)
+        self.assertEqual(indexing.flush(), 0)
+
+    def test_unsupported(self):
+        """Content is cataloged immediately if the task doesn't keep
+        the requests where expected.
+        """
+        task = CatalogingTask.get()
+        unindex = task._unindex
+        del task._unindex
+        self.addCleanup(setattr, task, '_unindex', unindex)
+        indexing = DeferredIndexing(2)
+        with LogRecorder() as messages:
+            indexing.start()
+            indexing.start()
+        self.assertEqual(
+            messages, [u'Cannot defer the cataloging of imported content.'])
+        self.add_folders(2)
+        self.assertEqual(len(indexing), 0)
+        self.assertEqual(indexing.flush(), 0)
+        self.assertFalse(task._active)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(DeferredIndexingTestCase))
+    return suite
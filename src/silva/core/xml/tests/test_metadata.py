@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from silva.core.xml import Exporter, Importer, handlers
+
+NS_TEST_URI = 'urn:test'
+
+
+class Validator(object):
+
+    def serializeValue(self, field, value, producer):
+        pass
+
+    def deserializeValue(self, field, value, context):
+        return value.upper()
+
+
+class Field(object):
+    validator = Validator()
+
+
+class MetadataElement(object):
+
+    def __init__(self, identifier, read_only=False, automatic=False):
+        self.identifier = identifier
+        self.field = Field()
+        self.read_only_p = read_only
+        self.automatic_p = automatic
+
+    def getId(self):
+        return self.identifier
+
+
+class MetadataSet(object):
+    """Metadata set counting the lookups of its elements.
+    """
+
+    def __init__(self, identifier, *elements):
+        self.identifier = identifier
+        self.elements = elements
+        self.lookups = 0
+
+    def getNamespace(self):
+        return (self.identifier, NS_TEST_URI + ':' + self.identifier)
+
+    def getElements(self):
+        self.lookups += 1
+        return self.elements
+
+
+class Binding(object):
+    """Metadata binding of a content, using the given sets.
+    """
+    read_only = False
+
+    def __init__(self, *sets):
+        self.collection = dict((s.identifier, s) for s in sets)
+        self.setnames = [s.identifier for s in sets]
+        self.stored = []
+
+    def getSetNames(self):
+        return tuple(self.setnames)
+
+    def getSet(self, set_id):
+        return self.collection[set_id]
+
+    def setValues(self, set_id, values, reindex=1):
+        self.stored.append((set_id, values))
+        return {}
+
+
+class Content(object):
+
+    def __init__(self, binding):
+        self.service_metadata = self
+        self.binding = binding
+
+    def getMetadata(self, content):
+        return self.binding
+
+
+class Container(object):
+    """Container of imported contents, all using the same binding.
+    """
+
+    def __init__(self, binding):
+        self.binding = binding
+
+    def _getOb(self, identifier):
+        return Content(self.binding)
+
+
+class ExporterMetadataTestCase(unittest.TestCase):
+    """Test the metadata schemas computed by the exporter.
+    """
+
+    def setUp(self):
+        self.title = MetadataElement('title')
+        self.content = MetadataSet('content', self.title)
+        self.extra = MetadataSet('extra', MetadataElement('keywords'))
+        self.exporter = Exporter(None, None, {})
+
+    def test_schema(self):
+        """Sets are sorted, with their namespace and the fields of
+        their elements.
+        """
+        schema = self.exporter.getMetadataSchema(
+            Binding(self.extra, self.content))
+        self.assertEqual(
+            [(set_id, prefix, namespace, sorted(elements))
+             for set_id, prefix, namespace, elements in schema.sets],
+            [('content', 'content', 'urn:test:content', ['title']),
+             ('extra', 'extra', 'urn:test:extra', ['keywords'])])
+        field, serialize = schema.sets[0][3]['title']
+        self.assertIs(field, self.title.field)
+        self.assertEqual(serialize, field.validator.serializeValue)
+
+    def test_cached(self):
+        """Bindings with the same sets share their schema.
+        """
+        schema = self.exporter.getMetadataSchema(
+            Binding(self.content, self.extra))
+        self.assertIs(
+            self.exporter.getMetadataSchema(
+                Binding(self.content, self.extra)),
+            schema)
+        self.assertEqual(self.content.lookups, 1)
+        self.assertEqual(self.extra.lookups, 1)
+
+        other = self.exporter.getMetadataSchema(Binding(self.content))
+        self.assertIsNot(other, schema)
+        self.assertEqual([s[0] for s in other.sets], ['content'])
+        self.assertEqual(self.content.lookups, 2)
+
+        # The cache is kept by export.
+        Exporter(None, None, {}).getMetadataSchema(Binding(self.content))
+        self.assertEqual(self.content.lookups, 3)
+
+
+class ImporterMetadataTestCase(unittest.TestCase):
+    """Test the metadata schemas and unknown metadata of the importer.
+    """
+
+    def setUp(self):
+        self.content = MetadataSet(
+            'content',
+            MetadataElement('title'),
+            MetadataElement('modified', read_only=True),
+            MetadataElement('creator', read_only=True, automatic=True))
+        self.binding = Binding(self.content)
+        self.importer = Importer(None, None)
+
+    def store(self, identifier, **metadata):
+        handler = handlers.Handler(
+            Container(self.binding), None, extra=self.importer)
+        handler.setResultId(identifier)
+        for set_id, values in metadata.items():
+            handler.setMetadata(set_id, values)
+        handler.storeMetadata()
+
+    def test_schema(self):
+        """Writable elements are computed once by set names.
+        """
+        schema = self.importer.getMetadataSchema(self.binding)
+        self.assertEqual(sorted(schema), ['content'])
+        self.assertEqual(sorted(schema['content']), ['creator', 'title'])
+        field, deserialize = schema['content']['title']
+        self.assertIs(field, self.content.elements[0].field)
+        self.assertEqual(deserialize, field.validator.deserializeValue)
+        self.assertIs(
+            self.importer.getMetadataSchema(Binding(self.content)), schema)
+        self.assertEqual(self.content.lookups, 1)
+
+    def test_unknown(self):
+        """Unknown sets and elements are counted, instead of being
+        logged for each content.
+        """
+        for identifier in ['document', 'image']:
+            self.store(
+                identifier,
+                content={'title': identifier, 'modified': 'today'},
+                other={'title': identifier})
+        self.assertEqual(
+            self.binding.stored,
+            [('content', {'title': 'DOCUMENT'}),
+             ('content', {'title': 'IMAGE'})])
+        self.assertEqual(self.content.lookups, 1)
+        self.assertEqual(
+            self.importer.getUnknownMetadata(),
+            {('content', 'modified'): 2, ('other', None): 2})
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ExporterMetadataTestCase))
+    suite.addTest(unittest.makeSuite(ImporterMetadataTestCase))
+    return suite
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Exporter
+from silva.core.xml.xmlexport import BufferedOutput
+
+
+class Output(object):
+    """Writable object recording each write.
+    """
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def getvalue(self):
+        return b''.join(self.writes)
+
+
+class BufferedOutputTestCase(unittest.TestCase):
+    """Test the buffering of the writes of the XML generator.
+    """
+
+    def test_chunks(self):
+        output = Output()
+        buffered = BufferedOutput(output, 4)
+        for data in [b'<a', b'>', b'te', b'xt</a>']:
+            buffered.write(data)
+        # Writes are joined until they are at least 4 bytes.
+        self.assertEqual(output.writes, [b'<a>te', b'xt</a>'])
+        buffered.flush()
+        buffered.flush()
+        self.assertEqual(output.writes, [b'<a>te', b'xt</a>'])
+
+        buffered.write(b'<b/>')
+        buffered.write(b'\n')
+        buffered.flush()
+        self.assertEqual(output.writes, [b'<a>te', b'xt</a>', b'<b/>', b'\n'])
+
+
+class WriteToTestCase(unittest.TestCase):
+    """Test that writeTo writes the XML returned by getString.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('author')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addPublication('publication', u'Publication')
+        factory = self.root.publication.manage_addProduct['Silva']
+        factory.manage_addAutoTOC('index', u'Table des mati\xe8res')
+        for index in range(10):
+            factory.manage_addFolder(
+                'folder%d' % index, u'Dossier <%d> & co' % index)
+
+    def export(self, **options):
+        return Exporter(self.root.publication, TestRequest(), options)
+
+    def test_write(self):
+        expected = self.export().getString()
+        self.assertIn(u'Table des mati\xe8res'.encode('utf-8'), expected)
+        for flush_size in [1, 100, 1024, None]:
+            output = Output()
+            self.export().writeTo(output, flush_size)
+            self.assertEqual(output.getvalue(), expected)
+            # Only the last write can be smaller than the flush size.
+            for data in output.writes[:-1]:
+                self.assertGreaterEqual(
+                    len(data), flush_size or Exporter.flush_size)
+
+    def test_encoding(self):
+        expected = self.export(encoding='latin-1').getString()
+        output = Output()
+        self.export(encoding='latin-1').writeTo(output, 10)
+        self.assertEqual(output.getvalue(), expected)
+        self.assertIn(u'Table des mati\xe8res'.encode('latin-1'), expected)
+
+    def test_once(self):
+        exporter = self.export()
+        exporter.writeTo(Output())
+        self.assertRaises(AssertionError, exporter.writeTo, Output())
+        self.assertRaises(AssertionError, exporter.getString)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(BufferedOutputTestCase))
+    suite.addTest(unittest.makeSuite(WriteToTestCase))
+    return suite
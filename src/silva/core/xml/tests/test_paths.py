@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Importer
+from silva.core.xml.xmlimport import ImportedPaths
+
+
+class ImportedPathsTestCase(unittest.TestCase):
+    """Test that imported paths behave like the dictionary of joined
+    paths that was used before.
+    """
+
+    def setUp(self):
+        self.paths = ImportedPaths()
+        self.expected = {}
+
+    def set(self, original, imported):
+        self.paths.set(original.split('/'), imported.split('/'))
+        self.expected[original] = imported
+
+    def assertLookups(self, *others):
+        for original in list(self.expected) + list(others):
+            imported = self.paths.get(original.split('/'))
+            if imported is not None:
+                imported = u'/'.join(imported)
+            self.assertEqual(imported, self.expected.get(original))
+
+    def test_unchanged(self):
+        self.set('root', 'root')
+        self.set('root/folder', 'root/folder')
+        self.set('root/folder/document', 'root/folder/document')
+        self.assertLookups('root/other', 'root/folder/other', 'other')
+        self.assertEqual(len(self.paths), 3)
+        self.assertEqual(self.paths._rules, {})
+
+    def test_renamed_root(self):
+        """Only one rule is needed for the content of a renamed root.
+        """
+        self.set('root', 'imported')
+        self.set('root/folder', 'imported/folder')
+        self.set('root/folder/document', 'imported/folder/document')
+        self.set('root/document', 'imported/document')
+        self.assertLookups('root/other', 'root/folder/other', 'imported')
+        self.assertEqual(len(self.paths._rules), 1)
+
+    def test_renamed_content(self):
+        """Renamed content inside a renamed root adds a rule for its
+        own prefix.
+        """
+        self.set('root', 'imported')
+        self.set('root/folder', 'imported/import_of_folder')
+        self.set('root/folder/document', 'imported/import_of_folder/document')
+        self.set('root/folder/data', 'imported/import_of_folder/data')
+        self.set('root/other', 'imported/other')
+        self.set('root/other/folder', 'imported/other/folder')
+        self.assertLookups(
+            'root/folder/other', 'root/other/folder/other', 'root/folder2')
+        self.assertEqual(len(self.paths._rules), 2)
+
+    def test_conflict(self):
+        """Content that does not follow the rule of its container
+        records its own path.
+        """
+        self.set('root', 'imported')
+        self.set('root/folder', 'imported/folder')
+        self.set('root/folder/data', 'imported/folder/data')
+        self.set('root/folder/document', 'elsewhere/document')
+        self.set('root/folder/document/image', 'elsewhere/document/image')
+        self.set('root/folder/image', 'imported/folder/image')
+        self.assertLookups('root/folder/other')
+
+    def test_contents_first(self):
+        """Contents are recorded before their containers during an
+        import, and don't need more rules.
+        """
+        self.set('root/folder/data/image',
+                 'imported/folder/import_of_data/image')
+        self.set('root/folder/data', 'imported/folder/import_of_data')
+        self.set('root/folder/document', 'imported/folder/document')
+        self.set('root/folder', 'imported/folder')
+        self.set('root/document', 'imported/document')
+        self.set('root', 'imported')
+        self.assertLookups('root/folder/data/other', 'root/other')
+        self.assertEqual(len(self.paths._rules), 2)
+        self.assertEqual(self.paths._exceptions, {})
+
+    def test_orphans(self):
+        """Paths whose containers were not recorded are looked up
+        like the others.
+        """
+        self.set('root/folder/document', 'root/folder/document')
+        self.set('root/folder/data', 'imported/data')
+        self.set('root/folder/image', 'other/image')
+        self.set('root/image', 'other/image')
+        self.assertLookups('root/folder', 'root', 'root/folder/other')
+
+    def test_reset(self):
+        """Setting a path again replaces the imported path, like in a
+        dictionary.
+        """
+        self.set('root', 'imported')
+        self.set('root/folder', 'imported/folder')
+        self.set('root/folder/document', 'imported/folder/document')
+        self.set('root/folder', 'imported/import_of_folder')
+        self.assertLookups()
+        self.set('root/folder', 'imported/folder')
+        self.assertLookups()
+
+    def test_many(self):
+        """Paths are looked up the same way once their digests are
+        merged in the sorted array.
+        """
+        self.set('root', 'imported')
+        for index in range(3000):
+            folder = 'folder%d' % (index // 100)
+            self.set('root/%s/document%d' % (folder, index),
+                     'imported/%s/document%d' % (folder, index))
+            if index % 7 == 0:
+                self.set('root/%s/image%d' % (folder, index),
+                         'imported/%s/import_of_image%d' % (folder, index))
+        self.assertGreater(len(self.paths._paths._digests), 0)
+        self.assertLookups('root/folder1/document3000', 'root/folder1')
+        self.assertEqual(len(self.paths), len(self.expected))
+
+
+class Content(object):
+    """Content recording the identifiers traversed from it.
+    """
+
+    def __init__(self, identifier, container=None):
+        self.identifier = identifier
+        self.container = container
+        self.contents = {}
+        self.traversed = []
+        if container is not None:
+            container.contents[identifier] = self
+
+    def getPhysicalPath(self):
+        if self.container is None:
+            return ('', self.identifier)
+        return self.container.getPhysicalPath() + (self.identifier,)
+
+    def unrestrictedTraverse(self, path, default=KeyError):
+        if path[:1] == ('',):
+            # Problems are reported with physical paths.
+            return self if tuple(path) == self.getPhysicalPath() else default
+        content = self
+        for identifier in path:
+            content.traversed.append(identifier)
+            if identifier not in content.contents:
+                if default is KeyError:
+                    raise KeyError(identifier)
+                return default
+            content = content.contents[identifier]
+        return content
+
+
+class ImporterTraversalTestCase(unittest.TestCase):
+    """Test that imported paths are resolved in order, reusing the
+    content traversed for the previous path.
+    """
+
+    def setUp(self):
+        self.root = Content('root')
+        self.folder = Content('folder', self.root)
+        Content('document', self.folder)
+        Content('image', self.folder)
+        Content('data', Content('other', self.root))
+        self.importer = Importer(self.root, None)
+        self.resolved = []
+
+    def resolve(self, path):
+        self.importer.resolveImportedPath(
+            self.root, self.resolved.append, path)
+
+    def test_resolve(self):
+        self.importer.addImportedPath(
+            ['source', 'image'], ['folder', 'image'])
+        self.resolve('root:other/data')
+        self.resolve('source/image')
+        self.resolve('root:folder/missing')
+        self.resolve('root:folder/document')
+        self.importer.runActions()
+        self.assertEqual(
+            [content.getPhysicalPath() for content in self.resolved],
+            [('', 'root', 'folder', 'document'),
+             ('', 'root', 'folder', 'image'),
+             ('', 'root', 'other', 'data')])
+        self.assertEqual(
+            self.importer.getProblems(),
+            [(u'Refered path folder/missing is not found in the import.',
+              self.root)])
+        # Each content is traversed once from its container.
+        self.assertEqual(self.root.traversed, ['folder', 'other'])
+        self.assertEqual(
+            self.folder.traversed, ['document', 'image', 'missing'])
+        self.assertEqual(
+            self.importer.getTraversalStatistics(),
+            {'hits': 2, 'misses': 5})
+
+
+class ImporterPathsTestCase(unittest.TestCase):
+    """Test the imported paths of the importer.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+
+    def test_imported_path(self):
+        importer = Importer(self.root, TestRequest())
+        expected = {}
+        for original, imported in [
+            ('root', 'root/import_of_root'),
+            ('root/folder', 'root/import_of_root/folder'),
+            ('root/folder/data', 'root/import_of_root/folder/import_of_data'),
+            ('root/folder/data/image', 'root/import_of_root/folder/'
+             'import_of_data/image'),
+            ('root/document', 'root/import_of_root/document')]:
+            importer.addImportedPath(original.split('/'), imported.split('/'))
+            expected[original] = imported
+        for original in list(expected) + ['root/other', 'root/folder/x', '']:
+            self.assertEqual(
+                importer.getImportedPath(original), expected.get(original))
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ImportedPathsTestCase))
+    suite.addTest(unittest.makeSuite(ImporterTraversalTestCase))
+    suite.addTest(unittest.makeSuite(ImporterPathsTestCase))
+    return suite
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import io
+import unittest
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Exporter, Importer
+from silva.core.xml.problems import Problems
+
+
+class Content(object):
+
+    def __init__(self, path):
+        self.path = path
+
+    def getPhysicalPath(self):
+        return self.path
+
+
+class Root(object):
+
+    def __init__(self, *contents):
+        self.contents = dict((content.path, content) for content in contents)
+
+    def unrestrictedTraverse(self, path, default=None):
+        return self.contents.get(tuple(path), default)
+
+
+class ProblemsTestCase(unittest.TestCase):
+    """Test the aggregation of problems.
+    """
+
+    def test_aggregate(self):
+        """Identical problems are counted, and listed in the order
+        they were first reported.
+        """
+        document = Content(('', 'root', 'document'))
+        folder = Content(('', 'root', 'folder'))
+        problems = Problems()
+        problems.add(u'Broken reference.', document)
+        problems.add(u'Missing file.', folder)
+        problems.add(u'Broken reference.', document, 2)
+        problems.add(u'Broken reference.', folder)
+        problems.addPath(u'Missing file.', ('', 'root', 'folder'))
+        problems.add(u'Export failed.')
+        self.assertEqual(
+            list(problems),
+            [(u'Broken reference.', ('', 'root', 'document'), 3),
+             (u'Missing file.', ('', 'root', 'folder'), 2),
+             (u'Broken reference.', ('', 'root', 'folder'), 1),
+             (u'Export failed.', None, 1)])
+        self.assertEqual(len(problems), 7)
+        self.assertEqual(
+            problems.getProblems(Root(document)),
+            [(u'Broken reference.', document),
+             (u'Missing file.', None),
+             (u'Broken reference.', None),
+             (u'Export failed.', None)])
+
+    def test_reasons(self):
+        """Identical reasons are only kept once.
+        """
+        problems = Problems()
+        problems.addPath(u''.join([u'Broken', u' reference.']), ('a',))
+        problems.addPath(u''.join([u'Broken', u' reference.']), ('b',))
+        first, second = [reason for reason, path, count in problems]
+        self.assertEqual(first, second)
+        self.assertIs(first, second)
+
+    def test_limit(self):
+        """Above the limit, problems are counted by reason, then only
+        counted.
+        """
+        problems = Problems(limit=2)
+        for index in range(4):
+            problems.addPath(u'Broken reference.', ('doc%d' % index,))
+        problems.addPath(u'Missing file.', ('file',), 3)
+        problems.addPath(u'Export failed.', ('folder',))
+        problems.addPath(u'Broken reference.', ('doc0',))
+        self.assertEqual(
+            list(problems),
+            [(u'Broken reference.', ('doc0',), 2),
+             (u'Broken reference.', ('doc1',), 1),
+             (u'Broken reference.', None, 2),
+             (u'Missing file.', None, 3),
+             (u'1 other problem(s) are not detailed.', None, 1)])
+        self.assertEqual(len(problems), 9)
+
+
+class ProblemsExportImportTestCase(unittest.TestCase):
+    """Test that problems of an export are imported with their count.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('folder', 'Folder')
+        factory.manage_addFolder('imported', 'Imported')
+        factory = self.root.folder.manage_addProduct['Silva']
+        factory.manage_addFolder('data', 'Data')
+
+    def test_count(self):
+        exporter = Exporter(self.root.folder, TestRequest(), {})
+        for index in range(3):
+            exporter.reportProblem(u'Broken reference.', self.root.folder.data)
+        exporter.reportProblem(u'Export failed.')
+        data = exporter.getString()
+        self.assertIn(b'count="3"', data)
+
+        importer = Importer(self.root.imported, TestRequest(), {})
+        importer.importStream(io.BytesIO(data))
+        self.assertEqual(
+            list(importer.problems),
+            [(u'Export failed.', None, 1),
+             (u'Broken reference.',
+              self.root.imported.folder.data.getPhysicalPath(), 3)])
+
+    def test_limit(self):
+        """Problems above the limit are imported without content.
+        """
+        exporter = Exporter(
+            self.root.folder, TestRequest(), {'problems_limit': 1})
+        exporter.reportProblem(u'Export failed.', self.root.folder)
+        for index in range(2):
+            exporter.reportProblem(u'Broken reference.', self.root.folder.data)
+        data = exporter.getString()
+
+        importer = Importer(self.root.imported, TestRequest(), {})
+        importer.importStream(io.BytesIO(data))
+        self.assertEqual(
+            list(importer.problems),
+            [(u'Broken reference.', None, 2),
+             (u'Export failed.',
+              self.root.imported.folder.getPhysicalPath(), 1)])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ProblemsTestCase))
+    suite.addTest(unittest.makeSuite(ProblemsExportImportTestCase))
+    return suite
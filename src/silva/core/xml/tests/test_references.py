@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from silva.core.xml import Exporter
+from silva.core.xml.producers import SilvaProducer
+from silva.core.xml.xmlexport import registry
+
+
+class Content(object):
+    """Content counting the lookups of its physical path.
+    """
+
+    def __init__(self, path):
+        self.path = tuple(path.split('/'))
+        self.lookups = 0
+
+    def getId(self):
+        return self.path[-1]
+
+    def getPhysicalPath(self):
+        self.lookups += 1
+        return self.path
+
+
+class Reference(object):
+
+    def __init__(self, target, target_id):
+        self.target = target
+        self.target_id = target_id
+
+
+class ReferenceService(object):
+    """Return the same references from every content.
+    """
+
+    def __init__(self, *references):
+        self.references = references
+
+    def get_references_from(self, content, name=None):
+        return iter(self.references)
+
+
+class Configuration(object):
+    """Export configuration of a producer.
+    """
+    handler = None
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def getExported(self):
+        return self.exporter
+
+    def getExtra(self):
+        return self.exporter
+
+    def getOptions(self):
+        return registry.getOptions(self.exporter.options)
+
+
+class ReferencePathsTestCase(unittest.TestCase):
+    """Test the paths of the reference targets of an export.
+    """
+
+    def setUp(self):
+        self.root = Content('/root/folder')
+        self.document = Content('/root/folder/document')
+        self.other = Content('/root/other')
+        self.exporter = Exporter(
+            self.root, None, {'external_references': True})
+
+    def test_paths(self):
+        exporter = self.exporter
+        self.assertEqual(
+            exporter.getReferencePath(Reference(self.document, 1)),
+            'folder/document')
+        self.assertEqual(
+            exporter.getReferencePath(Reference(self.root, 2)), 'folder')
+        # Targets outside of the export, or missing, have no path.
+        self.assertIs(exporter.getReferencePath(Reference(self.other, 3)),
+                      None)
+        self.assertIs(exporter.getReferencePath(Reference(None, 4)), None)
+
+    def test_cached(self):
+        """Paths are computed once by target.
+        """
+        for index in range(3):
+            self.assertEqual(
+                self.exporter.getReferencePath(Reference(self.document, 1)),
+                'folder/document')
+            self.assertIs(
+                self.exporter.getReferencePath(Reference(self.other, 3)),
+                None)
+        self.assertEqual(self.document.lookups, 1)
+        self.assertEqual(self.other.lookups, 1)
+
+    def test_references(self):
+        """Broken references are reported as a problem, and not as
+        references outside of the export.
+        """
+        self.exporter.referenceService = ReferenceService(
+            Reference(self.document, 1),
+            Reference(None, 0),
+            Reference(self.other, 3),
+            Reference(self.document, 1),
+            Reference(None, None))
+        links = Content('/root/folder/links')
+        producer = SilvaProducer(links, Configuration(self.exporter))
+        self.assertEqual(
+            list(producer.get_references('links')),
+            ['folder/document', '', 'folder/document', ''])
+        self.assertEqual(self.document.lookups, 1)
+        self.assertEqual(
+            [(reason, path) for reason, path, count in self.exporter.problems],
+            [(u'Content contains 2 broken reference(s) in the export.',
+              links.path),
+             (u'Content contains 1 reference(s) pointing outside of the '
+              u'export.',
+              links.path)])
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ReferencePathsTestCase))
+    return suite
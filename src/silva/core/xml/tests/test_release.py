@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+import transaction
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import Exporter
+
+
+class ReleasingExporter(Exporter):
+    """Remember the paths of the released content.
+    """
+
+    def __init__(self, *args):
+        super(ReleasingExporter, self).__init__(*args)
+        self.released = []
+
+    def releaseObject(self, content):
+        self.released.append('/'.join(content.getPhysicalPath()))
+        super(ReleasingExporter, self).releaseObject(content)
+
+
+class KeepingExporter(ReleasingExporter):
+    """Measure the peak number of active objects, without releasing
+    the exported content.
+    """
+
+    def releaseObject(self, content):
+        self.released.append('/'.join(content.getPhysicalPath()))
+        active = self.root._p_jar._cache.cache_non_ghost_count
+        if active > self.peak_active_objects:
+            self.peak_active_objects = active
+
+
+class ReleaseObjectsTestCase(unittest.TestCase):
+    """Test that exported content is released from the ZODB cache.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('folder', 'Folder')
+        factory = self.root.folder.manage_addProduct['Silva']
+        for index in range(20):
+            factory.manage_addFolder('sub%d' % index, 'Sub')
+            sub = getattr(self.root.folder, 'sub%d' % index)
+            for sub_index in range(5):
+                sub.manage_addProduct['Silva'].manage_addFolder(
+                    'data%d' % sub_index, 'Data')
+        transaction.commit()
+
+    def export(self, factory, options):
+        # Start with an empty cache.
+        self.root._p_jar.cacheMinimize()
+        exporter = factory(self.root.folder, TestRequest(), options)
+        data = exporter.getString()
+        self.assertEqual(exporter.getProblems(), [])
+        return exporter, data
+
+    def test_peak(self):
+        kept, kept_data = self.export(KeepingExporter, {'release_objects': 1})
+        released, data = self.export(
+            ReleasingExporter, {'release_objects': 10})
+        # Releasing content doesn't change the export.
+        self.assertEqual(data, kept_data)
+        self.assertIn(b'<folder id="data4">', data)
+        # Each content is released once it is exported.
+        paths = ['/root/folder/sub%d' % index for index in range(20)]
+        paths.extend(
+            '%s/data%d' % (path, sub_index)
+            for path in paths[:] for sub_index in range(5))
+        paths.append('/root/folder')
+        self.assertEqual(sorted(released.released), sorted(paths))
+        self.assertEqual(released.released, kept.released)
+        self.assertEqual(released.released[-1], '/root/folder')
+        self.assertTrue(kept.peak_active_objects > 0)
+        self.assertTrue(
+            released.peak_active_objects < kept.peak_active_objects)
+
+    def test_disabled(self):
+        exporter, data = self.export(ReleasingExporter, {})
+        self.assertEqual(exporter.released, [])
+        self.assertEqual(exporter.peak_active_objects, 0)
+        self.assertIn(b'<folder id="data4">', data)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ReleaseObjectsTestCase))
+    return suite
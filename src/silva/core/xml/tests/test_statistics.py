@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import unittest
+
+from silva.core.xml.statistics import Statistics
+
+
+class Action(object):
+
+    def run(self):
+        pass
+
+
+def make_action():
+    def action():
+        pass
+    return action
+
+
+class StatisticsTestCase(unittest.TestCase):
+    """Test the collected statistics.
+    """
+
+    def test_measure(self):
+        statistics = Statistics()
+        with statistics.measure(Action):
+            statistics.written += 10
+            with statistics.measure(make_action):
+                statistics.written += 5
+        result = statistics.getStatistics()
+        self.assertEqual(
+            sorted(result),
+            [__name__ + '.Action', __name__ + '.make_action'])
+        action = result[__name__ + '.Action']
+        self.assertEqual(action['calls'], 1)
+        self.assertEqual(action['bytes'], 10)
+        self.assertTrue(action['cumulative'] >= action['self'])
+        self.assertEqual(result[__name__ + '.make_action']['bytes'], 5)
+
+    def test_same_name(self):
+        """Keys reported under the same name are added together, and
+        don't add entries.
+        """
+        statistics = Statistics()
+        for index in range(5):
+            statistics.add(Action().run, 1.0)
+            statistics.add(make_action(), 2.0, 1.0, 10)
+        self.assertEqual(len(statistics._entries), 2)
+        result = statistics.getStatistics()
+        self.assertEqual(
+            result[__name__ + '.run'],
+            {'calls': 5, 'cumulative': 5.0, 'self': 5.0, 'bytes': 0})
+        self.assertEqual(
+            result[__name__ + '.action'],
+            {'calls': 5, 'cumulative': 10.0, 'self': 5.0, 'bytes': 50})
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(StatisticsTestCase))
+    return suite
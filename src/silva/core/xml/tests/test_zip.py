@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013  Infrae. All rights reserved.
+# See also LICENSE.txt
+
+import io
+import random
+import struct
+import tempfile
+import unittest
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+from Products.Silva.testing import FunctionalLayer, TestRequest
+
+from silva.core.xml import NS_SILVA_URI, ZipExporter, ZipImporter
+from silva.core.xml.archive import POLICIES, ZipWriter, get_policy
+
+
+def random_data(size, seed=0):
+    # Random data is not compressed by deflate.
+    generator = random.Random(seed)
+    return bytes(bytearray(generator.randint(0, 255) for i in range(size)))
+
+
+class Zip64Limits(object):
+    """Lower the limits above which Zip64 structures are used, in
+    order to write them with small archives.
+    """
+
+    def __init__(self, size, count):
+        self.limits = {'ZIP64_LIMIT': size, 'ZIP_FILECOUNT_LIMIT': count}
+
+    def __enter__(self):
+        self.previous = {}
+        for name, value in self.limits.items():
+            self.previous[name] = getattr(zipfile, name)
+            setattr(zipfile, name, value)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for name, value in self.previous.items():
+            setattr(zipfile, name, value)
+
+
+class RecordingZipImporter(ZipImporter):
+    """Remember the imported stream and the spools of the inflated
+    members.
+    """
+
+    def __init__(self, *args):
+        super(RecordingZipImporter, self).__init__(*args)
+        self.stream = None
+        self.spools = []
+
+    def importStream(self, stream):
+        self.stream = stream
+        return super(RecordingZipImporter, self).importStream(stream)
+
+    def _inflate(self, info):
+        spool = super(RecordingZipImporter, self)._inflate(info)
+        self.spools.append(spool)
+        return spool
+
+
+class ZipWriterTestCase(unittest.TestCase):
+    """Test archives written by ZipWriter.
+    """
+
+    def write(self, members, threads=0):
+        output = io.BytesIO()
+        writer = ZipWriter(output, chunk_size=1024, threads=threads)
+        for index, (name, data, compress_type) in enumerate(members):
+            if index % 3 == 0:
+                writer.writestr(name, data, compress_type)
+            elif index % 3 == 1:
+                member = writer.spool(name, compress_type, 1024)
+                member.write(data)
+                writer.add(member)
+            else:
+                member = writer.open(name, compress_type)
+                member.write(data)
+                writer.closeMember(member)
+        writer.close()
+        return output.getvalue()
+
+    def assertArchive(self, data, members):
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertEqual(archive.testzip(), None)
+        self.assertEqual(
+            [info.filename for info in archive.infolist()],
+            [name for name, payload, compress_type in members])
+        for name, payload, compress_type in members:
+            info = archive.getinfo(name)
+            self.assertEqual(info.compress_type, compress_type)
+            self.assertEqual(archive.read(name), payload)
+        archive.close()
+
+    def test_members(self):
+        members = []
+        for index in range(9):
+            compress_type = zipfile.ZIP_STORED
+            if index % 2:
+                compress_type = zipfile.ZIP_DEFLATED
+            members.append((
+                    'assets/%d' % index,
+                    random_data(3000, index) + b'text' * 1000,
+                    compress_type))
+        members.append((u'zexps/caf\xe9', b'', zipfile.ZIP_DEFLATED))
+        for threads in (0, 2):
+            self.assertArchive(self.write(members, threads), members)
+
+    def test_zip64(self):
+        """Zip64 structures are written for members and archives over
+        the limits.
+        """
+        members = [
+            ('assets/1', random_data(5000), zipfile.ZIP_STORED),
+            ('assets/2', random_data(5000, 1), zipfile.ZIP_DEFLATED),
+            ('assets/3', b'small', zipfile.ZIP_DEFLATED),
+            ('assets/4', random_data(500, 3), zipfile.ZIP_STORED)]
+        with Zip64Limits(1024, 2):
+            data = self.write(members)
+        self.assertIn(zipfile.stringEndArchive64, data)
+        self.assertArchive(data, members)
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        # The sizes of the first member are in a Zip64 extra field.
+        self.assertEqual(archive.getinfo('assets/1').extra[:2], b'\x01\x00')
+        archive.close()
+
+    def test_zip64_streamed(self):
+        """Members that are streamed without a size use Zip64 data
+        descriptors, and can go over the limits.
+        """
+        payload = random_data(2000)
+        output = io.BytesIO()
+        writer = ZipWriter(output)
+        with Zip64Limits(1024, 2):
+            member = writer.open('assets/1', zipfile.ZIP_STORED)
+            member.write(payload)
+            writer.closeMember(member)
+            member = writer.open('assets/2', zipfile.ZIP_STORED, size=100)
+            member.write(b'small')
+            writer.closeMember(member)
+            writer.close()
+        data = output.getvalue()
+        self.assertArchive(data, [
+                ('assets/1', payload, zipfile.ZIP_STORED),
+                ('assets/2', b'small', zipfile.ZIP_STORED)])
+        # The local header of the first member has a Zip64 extra field,
+        # and its data descriptor 8 bytes sizes.
+        header = zipfile.sizeFileHeader
+        self.assertEqual(
+            data[header + 8:header + 12], b'\x01\x00\x10\x00')
+        descriptor = data[header + 28 + 2000:header + 28 + 2024]
+        self.assertEqual(
+            struct.unpack('<4sLQQ', descriptor),
+            (b'PK\x07\x08', zlib.crc32(payload) & 0xffffffff, 2000, 2000))
+        # The second one has neither.
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        offset = archive.getinfo('assets/2').header_offset
+        archive.close()
+        self.assertEqual(
+            struct.unpack('<H', data[offset + 28:offset + 30]), (0,))
+        self.assertEqual(
+            data[offset + header + 8 + 5:offset + header + 8 + 5 + 16],
+            struct.pack('<4sLLL', b'PK\x07\x08',
+                        zlib.crc32(b'small') & 0xffffffff, 5, 5))
+
+        # A member larger than its given size can't use Zip64.
+        writer = ZipWriter(io.BytesIO())
+        with Zip64Limits(1024, 2):
+            member = writer.open('assets/1', zipfile.ZIP_STORED, size=100)
+            member.write(payload)
+            self.assertRaises(
+                zipfile.LargeZipFile, writer.closeMember, member)
+
+
+class CompressionPolicyTestCase(unittest.TestCase):
+    """Test the compression chosen for each member of an archive.
+    """
+
+    def assertCompressTypes(self, policy, members):
+        policy = get_policy(policy)
+        self.assertEqual(
+            [(name, policy.getCompressType(name, data))
+             for name, data, compress_type in members],
+            [(name, compress_type)
+             for name, data, compress_type in members])
+
+    def test_auto(self):
+        """Members that are already compressed, by their extension or
+        their first bytes, are stored.
+        """
+        self.assertCompressTypes('auto', [
+                ('silva.xml', None, zipfile.ZIP_DEFLATED),
+                ('zexps/1.zexp', None, zipfile.ZIP_DEFLATED),
+                ('assets/1.JPG', None, zipfile.ZIP_STORED),
+                ('assets/2.tar.gz', None, zipfile.ZIP_STORED),
+                ('assets/3.txt', b'Caf\xc3\xa9', zipfile.ZIP_DEFLATED),
+                ('assets/4', b'\x89PNG\r\n\x1a\n', zipfile.ZIP_STORED),
+                ('assets/5', b'%PDF-1.4', zipfile.ZIP_STORED),
+                ('assets/6', b'\x00\x00\x00\x18ftypmp42',
+                 zipfile.ZIP_STORED),
+                ('assets/7', b'<html>', zipfile.ZIP_DEFLATED),
+                ('assets/8', b'', zipfile.ZIP_DEFLATED)])
+
+    def test_deflate(self):
+        self.assertCompressTypes('deflate', [
+                ('silva.xml', None, zipfile.ZIP_DEFLATED),
+                ('assets/1.jpg', b'\xff\xd8\xff\xe0', zipfile.ZIP_DEFLATED),
+                ('assets/2', b'PK\x03\x04', zipfile.ZIP_DEFLATED)])
+
+    def test_stored(self):
+        self.assertCompressTypes('stored', [
+                ('silva.xml', None, zipfile.ZIP_STORED),
+                ('assets/1.txt', b'text', zipfile.ZIP_STORED)])
+
+    @unittest.skipIf('lzma' not in POLICIES, 'LZMA is not available')
+    def test_lzma(self):
+        self.assertCompressTypes('lzma', [
+                ('silva.xml', None, zipfile.ZIP_LZMA),
+                ('assets/1.png', None, zipfile.ZIP_STORED),
+                ('assets/2', b'GIF89a', zipfile.ZIP_STORED)])
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, get_policy, 'bzip2')
+
+
+class ZipRoundTripTestCase(unittest.TestCase):
+    """Export content with the ZipExporter, and import it back with
+    the ZipImporter.
+    """
+    layer = FunctionalLayer
+
+    def setUp(self):
+        self.root = self.layer.get_application()
+        self.layer.login('editor')
+        factory = self.root.manage_addProduct['Silva']
+        factory.manage_addFolder('folder', 'Folder')
+        factory.manage_addFolder('imported', 'Imported')
+        factory = self.root.folder.manage_addProduct['Silva']
+        with self.layer.open_fixture('torvald.jpg') as image:
+            factory.manage_addFile('image', 'Image', image)
+        with self.layer.open_fixture('test_file_text.txt') as text:
+            factory.manage_addFile('text', 'Text', text)
+        factory.manage_addFolder('sub', 'Sub')
+        factory = self.root.folder.sub.manage_addProduct['Silva']
+        with self.layer.open_fixture('torvald.jpg') as image:
+            factory.manage_addFile('copy', 'Copy', image)
+
+    def export(self, options):
+        exporter = ZipExporter(self.root.folder, TestRequest(), options)
+        output = io.BytesIO()
+        exporter.writeTo(output)
+        self.assertEqual(exporter.getProblems(), [])
+        return output.getvalue()
+
+    def assertImported(self, importer):
+        self.assertEqual(importer.getProblems(), [])
+        # Inflated members are released at the end of the import.
+        for spool in importer.spools:
+            self.assertTrue(spool.closed)
+        imported = self.root.imported.folder
+        for path in ['image', 'text', 'sub/copy']:
+            self.assertEqual(
+                imported.unrestrictedTraverse(path).get_file(),
+                self.root.folder.unrestrictedTraverse(path).get_file())
+
+    def roundtrip(self, options, import_options=None):
+        data = self.export(options)
+        importer = RecordingZipImporter(
+            self.root.imported, TestRequest(), import_options or {})
+        importer.importStream(io.BytesIO(data))
+        self.assertImported(importer)
+        return zipfile.ZipFile(io.BytesIO(data))
+
+    def get_assets(self, archive):
+        return dict((info.filename, info) for info in archive.infolist()
+                    if info.filename.startswith('assets/'))
+
+    def test_xml(self):
+        """The XML of the export root is stored in silva.xml.
+        """
+        archive = zipfile.ZipFile(io.BytesIO(self.export({})))
+        data = archive.read('silva.xml')
+        self.assertNotIn(b'unknown_content', data)
+        document = ElementTree.fromstring(data)
+        self.assertEqual(document.tag, '{%s}silva' % NS_SILVA_URI)
+        self.assertEqual(
+            [(element.tag, element.get('id')) for element in document],
+            [('{%s}folder' % NS_SILVA_URI, 'folder')])
+
+    def test_deflated(self):
+        archive = self.roundtrip({'compression': 'deflate'})
+        assets = self.get_assets(archive)
+        self.assertEqual(len(assets), 3)
+        for info in assets.values():
+            self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_stored(self):
+        archive = self.roundtrip(
+            {'compression': 'stored'}, {'prefetch_threads': 0})
+        assets = self.get_assets(archive)
+        self.assertEqual(len(assets), 3)
+        for info in assets.values():
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+
+    def test_auto(self):
+        """Images are stored, text is deflated.
+        """
+        archive = self.roundtrip({'compression': 'auto'})
+        self.assertEqual(
+            sorted(info.compress_type
+                   for info in self.get_assets(archive).values()),
+            [zipfile.ZIP_STORED, zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+
+    @unittest.skipIf('lzma' not in POLICIES, 'LZMA is not available')
+    def test_lzma(self):
+        """Members that are not deflated are inflated out of their own
+        view on the archive, while silva.xml is read.
+        """
+        archive = self.roundtrip({'compression': 'lzma'})
+        self.assertEqual(
+            sorted(info.compress_type
+                   for info in self.get_assets(archive).values()),
+            [zipfile.ZIP_STORED, zipfile.ZIP_STORED, zipfile.ZIP_LZMA])
+
+    def test_deduplicated(self):
+        """Files with the same payload share one asset.
+        """
+        archive = self.roundtrip(
+            {'compression': 'deflate', 'deduplicate_assets': True})
+        self.assertEqual(len(self.get_assets(archive)), 2)
+
+    def test_import_file(self):
+        """Archives are mapped in memory during the import.
+        """
+        data = self.export({'compression': 'auto'})
+        with tempfile.NamedTemporaryFile(suffix='.zip') as archive:
+            archive.write(data)
+            archive.flush()
+            importer = RecordingZipImporter(
+                self.root.imported, TestRequest(), {})
+            importer.importFile(archive.name)
+        self.assertImported(importer)
+        # The mapping is closed.
+        self.assertRaises(ValueError, importer.stream.read, 1)
+
+    def test_zip64(self):
+        with Zip64Limits(1024, 2):
+            data = self.export({'compression': 'deflate'})
+        self.assertIn(zipfile.stringEndArchive64, data)
+        importer = RecordingZipImporter(self.root.imported, TestRequest(), {})
+        importer.importStream(io.BytesIO(data))
+        self.assertImported(importer)
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ZipWriterTestCase))
+    suite.addTest(unittest.makeSuite(CompressionPolicyTestCase))
+    suite.addTest(unittest.makeSuite(ZipRoundTripTestCase))
+    return suite
@@ -2,18 +2,98 @@
 # Copyright (c) 2013  Infrae. All rights reserved.
 # See also LICENSE.txt
 
+import hashlib
+import inspect
+import io
+import logging
+import multiprocessing
 import os
+import tempfile
+import threading
 
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from AccessControl.SpecialUsers import system
+from Acquisition import aq_base
 from Products.Silva.ExtensionRegistry import extensionRegistry
+from Testing.makerequest import makerequest
+from ZODB.DemoStorage import DemoStorage
+from ZODB.FileStorage import FileStorage
 from sprout.saxext import xmlexport
+from sprout.saxext.generator import XMLGenerator
 from zope.cachedescriptors.property import Lazy
+from zope.component import getUtility
+from zope.component.hooks import setHooks, setSite
 
+from silva.core.interfaces import IAssetPayload, IContainer
+from silva.core.references.interfaces import IReferenceService
+from silva.core.references.utils import canonical_tuple_path, relative_tuple_path
+from silva.core.references.utils import is_inside_path
+from silva.core.services.interfaces import IMetadataService
 from silva.core.xml import NS_SILVA_URI
 from silva.core.xml import NS_SILVA_EXTRA_URI, NS_SILVA_CONTENT_URI
 from silva.core.xml import producers
+from silva.core.xml.archive import ZipWriter, get_policy
+from silva.core.xml.problems import Problems
+from silva.core.xml.statistics import Statistics
+
+import transaction
+
+logger = logging.getLogger('silva.core.xml')
+
+
+class SplicingGenerator(XMLGenerator):
+    """XML generator in which XML produced separately, in the same
+    encoding, can be inserted.
+    """
+
+    def __init__(self, out, encoding='UTF-8'):
+        XMLGenerator.__init__(self, out, encoding)
+        self._stream = out
+
+    def splice(self, stream, chunk_size=1 << 16):
+        """Copy the XML read from stream to the output.
+        """
+        # Finish the start tag of the current element.
+        self._processLast()
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            self._stream.write(data)
+
+
+class BufferedOutput(object):
+    """Collect the small writes of the XML generator, and write them
+    in chunks of at least flush_size bytes to the output.
+    """
+
+    def __init__(self, output, flush_size):
+        self._output = output
+        self._flush_size = flush_size
+        self._chunks = []
+        self._size = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._size >= self._flush_size:
+            self.flush()
+
+    def flush(self):
+        if self._chunks:
+            self._output.write(b''.join(self._chunks))
+            self._chunks = []
+            self._size = 0
 
 
 class Exporter(object):
+    # Size of the chunks written by writeTo.
+    flush_size = 1 << 16
+    # Suffix of the temporary file created by getStream.
+    suffix = '.xml'
+    # Prefix of the asset and zexp identifiers.
+    id_prefix = ''
 
     def __init__(self, root, request, options=None):
         self.__root = root
@@ -23,32 +103,221 @@ class Exporter(object):
         self.__executed = False
         self.__executing = False
         self.options = options
+        settings = registry.getOptions(options)
+        self.statistics = Statistics.create(settings.statistics)
+        self.problems = Problems(settings.problems_limit)
+        self.release_objects = settings.release_objects
+        # Measured only if release_objects is set.
+        self.peak_active_objects = 0
+        self.__released = 0
+        self.__workers = settings.fragment_workers
+        self.__database = settings.fragment_database
+        self.__timeout = settings.fragment_timeout
+        if settings.external_rendering:
+            # URLs would not be computed for the request of the export.
+            self.__workers = 0
+        self.__pool = None
+        self.__fragments = []
 
-        self._problems = []
         self._asset_paths = {}
         self._zexp_paths = {}
         self._last_asset_id = 0
         self._last_zexp_id = 0
+        self._metadata_schemas = {}
+        self._reference_paths = {}
+
+    def _export(self, stream):
+        self._startFragments()
+        try:
+            if self.statistics is not None:
+                stream = self.statistics.count(stream)
+                with self.statistics.profile():
+                    with self.statistics.measure(producers.ExporterProducer):
+                        registry.exportToStream(
+                            self, stream, self.options, extra=self)
+            else:
+                registry.exportToStream(
+                    self, stream, self.options, extra=self)
+        finally:
+            self._closeFragments()
 
     def getString(self):
+        if self.__executed and self.__string is None:
+            raise AssertionError('Not exported to a string')
         if not self.__executed:
             if self.__executing:
                 raise AssertionError('Currently exporting')
             self.__executing = True
-            self.__string = registry.exportToString(
-                self, self.options, extra=self)
+            stream = io.BytesIO()
+            self._export(stream)
+            self.__string = stream.getvalue()
             self.__executed = True
         return self.__string
 
     def getStream(self):
+        if self.__executed and self.__stream is None:
+            raise AssertionError('Not exported to a stream')
         if not self.__executed:
             if self.__executing:
                 raise AssertionError('Currently exporting')
-            self.__stream = registry.exportToTemporary(
-                self, self.options, extra=self)
+            self.__executing = True
+            result = xmlexport.ExporterTemporaryResult(
+                *tempfile.mkstemp(self.suffix))
+            try:
+                self._export(result.file)
+            except:
+                result.close()
+                raise
+            result.seek(0)
+            self.__stream = result
             self.__executed = True
         return self.__stream
 
+    def writeTo(self, output, flush_size=None):
+        """Export directly to the writable object output, without
+        keeping a copy of the result. Output is written in chunks of
+        flush_size bytes (default flush_size of the exporter).
+        """
+        if self.__executed or self.__executing:
+            raise AssertionError('Already exported')
+        self.__executing = True
+        if flush_size is None:
+            flush_size = self.flush_size
+        buffered = BufferedOutput(output, flush_size)
+        self._export(buffered)
+        buffered.flush()
+        self.__executed = True
+
+    def getStatistics(self):
+        """Return statistics about the producers, if the statistics
+        option is set.
+        """
+        if self.statistics is None:
+            return {}
+        return self.statistics.getStatistics()
+
+    def releaseObject(self, content):
+        """Release the exported content from the ZODB cache. Every
+        release_objects contents, the cache garbage collection is run.
+        """
+        connection = self.root._p_jar
+        if connection is None:
+            return
+        active = connection._cache.cache_non_ghost_count
+        if active > self.peak_active_objects:
+            self.peak_active_objects = active
+        # Modified content is not deactivated.
+        content = aq_base(content)
+        if (content is not aq_base(self.root) and
+            getattr(content, '_p_jar', None) is not None):
+            content._p_deactivate()
+        self.__released += 1
+        if self.__released >= self.release_objects:
+            connection.cacheGC()
+            self.__released = 0
+
+    def _startFragments(self):
+        """Start the fragment_workers worker processes, if they are
+        used. They are forked before the export starts any thread.
+        """
+        if (not self.__workers or self.__database is None or
+            self.__pool is not None):
+            return
+        reason = None
+        if threading.active_count() > 1:
+            # The workers would be forked with the state of the locks
+            # used by the other threads.
+            reason = u'other threads are running'
+        elif has_changes(self.root._p_jar):
+            # The workers would not see them.
+            reason = u'the transaction has uncommitted changes'
+        if reason is not None:
+            logger.warning(
+                u"Content is exported without worker processes: %s.",
+                reason)
+            self.__workers = 0
+            return
+        self.__pool = multiprocessing.Pool(
+            self.__workers, start_fragment_worker, (self.__database,))
+
+    def getFragments(self, container, contents):
+        """Start exporting the containers among the given contents of
+        the export root to XML fragments, in the worker processes.
+        Return the fragments by content identifier.
+        """
+        if (self.__pool is None or
+            aq_base(container) is not aq_base(self.root)):
+            return {}
+        options = dict(self.options or {})
+        options.update({
+                'statistics': False,
+                'fragment_workers': 0,
+                'fragment_database': None})
+        root_path = self.rootPath
+        fragments = {}
+        for content in contents:
+            if not IContainer.providedBy(content):
+                continue
+            # Identifiers are numbered in the order of the export.
+            index = len(self.__fragments) + 1
+            fragment = self.__pool.apply_async(
+                export_fragment,
+                (index, root_path, content.getPhysicalPath(), options))
+            self.__fragments.append(fragment)
+            fragments[content.getId()] = fragment
+        return fragments
+
+    def spliceFragment(self, handler, fragment):
+        """Write the XML of an exported fragment to handler, and merge
+        its problems, assets and zexps with the ones of the export.
+        Return False if the content must be exported instead: if the
+        XML can't be spliced, or if the worker processes failed to
+        export it, in which case they are stopped.
+        """
+        if fragment not in self.__fragments:
+            # The worker processes were stopped.
+            return False
+        if getattr(handler, 'splice', None) is None:
+            # The XML is not written by a SplicingGenerator.
+            return False
+        try:
+            filename, problems, assets, zexps = fragment.get(self.__timeout)
+        except Exception as error:
+            # The worker can fail to start, and never export it.
+            self._closeFragments()
+            self.__workers = 0
+            self.reportProblem(
+                u'Worker processes failed to export content ({0}), '
+                u'it is exported without them.'.format(
+                    error.__class__.__name__))
+            return False
+        try:
+            # The fragment is written with the encoding of the export.
+            with open(filename, 'rb') as stream:
+                handler.splice(stream, self.flush_size)
+        finally:
+            os.remove(filename)
+        self.__fragments.remove(fragment)
+        for problem, path, count in problems:
+            self.problems.addPath(problem, path, count)
+        for path, identifier in assets:
+            self._addAssetId(path, identifier)
+        for path, identifier in zexps:
+            self._addZexpId(path, identifier)
+        return True
+
+    def _closeFragments(self):
+        if self.__pool is None:
+            return
+        self.__pool.terminate()
+        self.__pool.join()
+        self.__pool = None
+        # Remove the fragments that were not used.
+        for fragment in self.__fragments:
+            if fragment.ready() and fragment.successful():
+                os.remove(fragment.get()[0])
+        self.__fragments = []
+
     def getVersion(self):
         return 'Silva %s' % extensionRegistry.get_extension('Silva').version
 
@@ -72,11 +341,59 @@ class Exporter(object):
     def request(self):
         return self.__request
 
+    @Lazy
+    def metadataService(self):
+        return getUtility(IMetadataService)
+
+    def getMetadataSchema(self, binding):
+        """Return the metadata schema for the sets of the given
+        binding.
+        """
+        key = binding.getSetNames()
+        schema = self._metadata_schemas.get(key)
+        if schema is None:
+            schema = self._metadata_schemas[key] = producers.MetadataSchema(
+                binding)
+        return schema
+
+    @Lazy
+    def contentTypes(self):
+        return producers.ContentTypes()
+
+    @Lazy
+    def referenceService(self):
+        return getUtility(IReferenceService)
+
+    def getReferencePath(self, reference):
+        """Return the path used in the export to refer to the target of
+        the given reference, or None if the target is not inside the
+        export. Paths are computed once per target.
+        """
+        target_id = reference.target_id
+        try:
+            return self._reference_paths[target_id]
+        except KeyError:
+            pass
+        path = None
+        target = reference.target
+        if target is not None:
+            target_path = target.getPhysicalPath()
+            if is_inside_path(self.rootPath, target_path):
+                # Add root path id as it is always mentioned in exports
+                path = '/'.join(canonical_tuple_path(
+                        [self.root.getId()] + relative_tuple_path(
+                            self.rootPath, target_path)))
+        self._reference_paths[target_id] = path
+        return path
+
     def addAssetPath(self, path):
         identifier = self._makeUniqueAssetId(path)
         self._asset_paths[path] = identifier
         return identifier
 
+    def _addAssetId(self, path, identifier):
+        self._asset_paths[path] = identifier
+
     def getAssetPathId(self, path):
         return self._asset_paths[path]
 
@@ -86,13 +403,16 @@ class Exporter(object):
     def _makeUniqueAssetId(self, path):
         base, ext = os.path.splitext(path[-1])
         self._last_asset_id += 1
-        return str(self._last_asset_id) + ext
+        return self.id_prefix + str(self._last_asset_id) + ext
 
     def addZexpPath(self, path):
         identifier = self._makeUniqueZexpId(path)
         self._zexp_paths[path] = identifier
         return identifier
 
+    def _addZexpId(self, path, identifier):
+        self._zexp_paths[path] = identifier
+
     def getZexpPathId(self, path):
         return self._zexp_paths[path]
 
@@ -101,20 +421,243 @@ class Exporter(object):
 
     def _makeUniqueZexpId(self, path):
         self._last_zexp_id += 1
-        return str(self._last_zexp_id) + '.zexp'
+        return self.id_prefix + str(self._last_zexp_id) + '.zexp'
 
     def reportProblem(self, problem, content=None):
-        self._problems.append((problem, content))
+        self.problems.add(problem, content)
 
     def getProblems(self):
-        return list(self._problems)
+        return self.problems.getProblems(self.root)
+
+
+class FragmentExporter(Exporter):
+    """Export the XML of one content of an export, in a worker
+    process. Its asset and zexp identifiers are prefixed with the
+    index of the fragment in the export.
+    """
+
+    def __init__(self, root, content, request, options, index):
+        super(FragmentExporter, self).__init__(root, request, options)
+        self.fragment = content
+        self.id_prefix = '%d_' % index
+
+    def writeFragment(self, stream):
+        options = dict(self.options, as_document=False)
+        registry.exportToStream(self, stream, options, extra=self)
+
+
+def has_changes(connection):
+    """Return True if objects are changed in the transaction of the
+    connection, or if it is not known.
+    """
+    registered = getattr(connection, '_registered_objects', None)
+    if registered is None:
+        return True
+    # Changes can be stored in a savepoint.
+    return (bool(registered) or
+            getattr(connection, '_savepoint_storage', None) is not None)
+
+
+def check_storage(storage):
+    """Verify that the storage can be used by a worker process.
+    """
+    if isinstance(storage, DemoStorage):
+        check_storage(storage.base)
+        check_storage(storage.changes)
+    elif isinstance(storage, FileStorage) and not storage.isReadOnly():
+        # Either the storage of the export process, whose file would
+        # be shared, or it is locked by it.
+        raise ValueError(
+            u"Worker processes must open FileStorage read-only.")
+
+
+# Database of the worker processes, or the error opening it.
+_database = None
+_error = None
+
+
+def start_fragment_worker(database):
+    global _database, _error
+    try:
+        _database = database()
+        check_storage(_database.storage)
+    except Exception as error:
+        # It is raised for each fragment, instead of starting workers
+        # that fail again.
+        _database = None
+        _error = error
+
+
+def export_fragment(index, root_path, path, options):
+    """Export the content at path to an XML fragment in a temporary
+    file, from a connection of the worker process. Return the file name
+    and the problems, assets and zexps of the fragment.
+    """
+    if _error is not None:
+        raise _error
+    connection = _database.open()
+    try:
+        application = makerequest(connection.root()['Application'])
+        newSecurityManager(None, system)
+        root = application.unrestrictedTraverse(root_path)
+        setHooks()
+        setSite(root.get_root())
+        exporter = FragmentExporter(
+            root, application.unrestrictedTraverse(path),
+            application.REQUEST, options, index)
+        handle, filename = tempfile.mkstemp('.xml')
+        try:
+            with os.fdopen(handle, 'wb') as stream:
+                exporter.writeFragment(stream)
+        except:
+            os.remove(filename)
+            raise
+        return (filename, list(exporter.problems),
+                list(exporter.getAssetPaths()),
+                list(exporter.getZexpPaths()))
+    finally:
+        setSite(None)
+        noSecurityManager()
+        transaction.abort()
+        connection.close()
+
+
+class ZipExporter(Exporter):
+    """Export to a Zip archive containing a silva.xml file, and the
+    assets and zexps it refers to.
+
+    Assets and zexps are written to the archive as soon as they are
+    exported, and the XML, compressed in a spooled temporary file, is
+    added last. The archive is written in one pass, to a stream that
+    doesn't need to be seekable.
+
+    Members are compressed following the compression policy option,
+    by compression_threads threads that run during the export.
+
+    With the deduplicate_assets option, assets with the same payload
+    are stored once in the archive, and share the same identifier.
+    """
+    suffix = '.zip'
+    # Size above which the compressed XML is spooled on the disk.
+    spool_size = 1 << 20
+    # Size of the chunks used to copy and compress members.
+    chunk_size = 1 << 16
+
+    def __init__(self, root, request, options=None):
+        super(ZipExporter, self).__init__(root, request, options)
+        self.__archive = None
+        self.__savepoint = False
+        self.__digests = None
+        options = registry.getOptions(options)
+        if options.deduplicate_assets:
+            self.__digests = {}
+        self.__policy = get_policy(options.compression)
+        self.__threads = options.compression_threads
+
+    def _export(self, stream):
+        # The worker processes are started before the compression
+        # threads.
+        self._startFragments()
+        self.__archive = archive = ZipWriter(
+            stream, self.chunk_size, self.__threads)
+        xml = archive.spool(
+            'silva.xml', self.__policy.getCompressType('silva.xml'),
+            self.spool_size)
+        try:
+            super(ZipExporter, self)._export(xml)
+        except:
+            archive.discard()
+            xml.target.close()
+            raise
+        archive.add(xml)
+        archive.close()
+        self.__archive = None
+
+    def _getPayload(self, path):
+        asset = self.root.unrestrictedTraverse(path)
+        payload = IAssetPayload(asset, None)
+        if payload is not None:
+            payload = payload.get_payload()
+        return payload
+
+    def _writeAsset(self, identifier, payload):
+        filename = 'assets/' + identifier
+        self.__archive.writestr(
+            filename, payload,
+            self.__policy.getCompressType(filename, payload))
+
+    def addAssetPath(self, path):
+        payload = self._getPayload(path)
+        if payload is None:
+            return super(ZipExporter, self).addAssetPath(path)
+        if self.__digests is not None:
+            key = (os.path.splitext(path[-1])[1],
+                   hashlib.sha1(payload).digest())
+            identifier = self.__digests.get(key)
+            if identifier is not None:
+                self._asset_paths[path] = identifier
+                return identifier
+        identifier = super(ZipExporter, self).addAssetPath(path)
+        if self.__digests is not None:
+            self.__digests[key] = identifier
+        self._writeAsset(identifier, payload)
+        return identifier
+
+    def _addAssetId(self, path, identifier):
+        # Assets of fragments are not deduplicated.
+        super(ZipExporter, self)._addAssetId(path, identifier)
+        payload = self._getPayload(path)
+        if payload is not None:
+            self._writeAsset(identifier, payload)
+
+    def addZexpPath(self, path):
+        identifier = super(ZipExporter, self).addZexpPath(path)
+        self._writeZexp(path, identifier)
+        return identifier
+
+    def _addZexpId(self, path, identifier):
+        super(ZipExporter, self)._addZexpId(path, identifier)
+        self._writeZexp(path, identifier)
+
+    def _writeZexp(self, path, identifier):
+        if not self.__savepoint:
+            # Content created in the same transaction than the export
+            # must be in the database in order to be exported.
+            transaction.savepoint()
+            self.__savepoint = True
+        content = self.root.unrestrictedTraverse(path)
+        filename = 'zexps/' + identifier
+        member = self.__archive.open(
+            filename, self.__policy.getCompressType(filename))
+        content._p_jar.exportFile(content._p_oid, member)
+        self.__archive.closeMember(member)
+
+
+class ProducerMapping(dict):
+    """Producers by class, looked up by sprout with the class of the
+    exported object: subclasses use the producer of their base class.
+    """
+
+    def get(self, cls, default=None):
+        for base in inspect.getmro(cls):
+            if base in self:
+                return self[base]
+        return default
+
+
+class ExporterRegistry(xmlexport.Exporter):
+
+    def __init__(self, *args, **kwargs):
+        super(ExporterRegistry, self).__init__(*args, **kwargs)
+        self._mapping = ProducerMapping()
 
 
 # Registry
-registry = xmlexport.Exporter(NS_SILVA_URI)
+registry = ExporterRegistry(NS_SILVA_URI, SplicingGenerator)
 registry.registerNamespace('silva-content', NS_SILVA_CONTENT_URI)
 registry.registerNamespace('silva-extra', NS_SILVA_EXTRA_URI)
 registry.registerProducer(Exporter, producers.ExporterProducer)
+registry.registerProducer(FragmentExporter, producers.FragmentProducer)
 registry.registerFallbackProducer(producers.ZexpProducer)
 # Generate URL instead of paths
 registry.registerOption('external_rendering', False)
@@ -131,6 +674,30 @@ registry.registerOption('only_previewable', False)
 # Export workflow information
 registry.registerOption('include_workflow', True)
 registry.registerOption('external_references', False)
+# Collect statistics (True), and profile the export ('profile')
+registry.registerOption('statistics', False)
+# Maximum number of distinct problems that are kept
+registry.registerOption('problems_limit', 1000)
+# Release exported content from the ZODB cache, collecting it every
+# release_objects contents (0 to disable)
+registry.registerOption('release_objects', 0)
+# Number of worker processes exporting the containers of the export
+# root, and callable returning the database they open (both are
+# needed). The callable must open a new database, with its
+# FileStorage read-only. Workers are only used if the transaction has
+# no changes and no other thread is running.
+registry.registerOption('fragment_workers', 0)
+registry.registerOption('fragment_database', None)
+# Seconds to wait for the export of each fragment, before exporting
+# without the worker processes
+registry.registerOption('fragment_timeout', 600)
+# Store assets with the same payload once (only with ZipExporter)
+registry.registerOption('deduplicate_assets', False)
+# Compression policy of the Zip archive members, see archive.POLICIES
+# (only with ZipExporter)
+registry.registerOption('compression', 'auto')
+# Number of threads compressing archive members (only with ZipExporter)
+registry.registerOption('compression_threads', 2)
 
 
 # Shortcuts
@@ -3,13 +3,202 @@
 # See also LICENSE.txt
 
 # test
-import io
+import array
+import bisect
+import collections
+import hashlib
+import logging
+import mmap
+import operator
+import shutil
+import struct
+import sys
+import tempfile
+import threading
 import zipfile
 
 from sprout.saxext import xmlimport
 from sprout.saxext import collapser
-from silva.core.interfaces import Error
+from zope.event import notify
+from silva.core.interfaces import Error, ContentImported
 from silva.core.references.utils import canonical_path
+from silva.core.xml.archive import MappedFile, SharedFile
+from silva.core.xml.archive import WorkerPool, InflateJob
+from silva.core.xml.archive import get_data_offset, inflate
+from silva.core.xml.checkpoint import Checkpoint, CheckpointHandler
+from silva.core.xml.indexing import DeferredIndexing
+from silva.core.xml.problems import Problems
+from silva.core.xml.statistics import Statistics, StatisticsHandler
+
+import transaction
+
+logger = logging.getLogger('silva.core.xml')
+
+
+try:
+    DIGEST_TYPECODE = array.array('q').typecode
+except ValueError:
+    # Python 2 arrays don't support long long.
+    DIGEST_TYPECODE = 'l'
+DIGEST_SIZE = struct.calcsize(DIGEST_TYPECODE)
+
+
+class Digests(object):
+    """Set of path digests, kept in a sorted array.
+    """
+
+    def __init__(self):
+        self._digests = array.array(DIGEST_TYPECODE)
+        self._pending = set()
+
+    def __contains__(self, digest):
+        if digest in self._pending:
+            return True
+        index = bisect.bisect_left(self._digests, digest)
+        return index < len(self._digests) and self._digests[index] == digest
+
+    def add(self, digest):
+        if digest in self:
+            return False
+        self._pending.add(digest)
+        if len(self._pending) > max(1024, len(self._digests) // 4):
+            self._digests = array.array(
+                DIGEST_TYPECODE, sorted(self._digests + array.array(
+                        DIGEST_TYPECODE, self._pending)))
+            self._pending.clear()
+        return True
+
+    def __len__(self):
+        return len(self._digests) + len(self._pending)
+
+
+class ImportedPaths(object):
+    """Map original paths to imported ones.
+
+    Only a digest of each original path is kept. Imported paths
+    are computed by rewriting a prefix of the original ones, rules
+    being recorded only for the paths that were renamed. A rule is
+    not added if it would change a recorded path: this path is
+    recorded as an exception instead.
+    """
+
+    def __init__(self):
+        self._paths = Digests()
+        # Prefixes that recorded paths rewrite with a shorter rule.
+        self._dependents = Digests()
+        self._rules = {}
+        self._exceptions = {}
+
+    def _digest(self, path):
+        digest = hashlib.md5(u'/'.join(path).encode('utf-8')).digest()
+        return struct.unpack(DIGEST_TYPECODE, digest[:DIGEST_SIZE])[0]
+
+    def _rule(self, path):
+        # Return the length of the prefix rewritten by a rule.
+        for index in range(len(path), -1, -1):
+            if path[:index] in self._rules:
+                return index
+        return -1
+
+    def _rewrite(self, path):
+        index = self._rule(path)
+        if index < 0:
+            return path
+        return self._rules[path[:index]] + path[index:]
+
+    def _addRule(self, original, imported, size):
+        prefix = original[:len(original) - size]
+        if (prefix not in self._rules and
+            self._digest(prefix) not in self._dependents):
+            self._rules[prefix] = imported[:len(imported) - size]
+
+    def set(self, original, imported):
+        original = tuple(original)
+        imported = tuple(imported)
+        self._exceptions.pop(original, None)
+        if self._rewrite(original) != imported:
+            # Record a rule rewriting only the prefix that differs,
+            # or else the path itself.
+            size = 0
+            while (size < len(original) and size < len(imported) and
+                   original[-1 - size] == imported[-1 - size]):
+                size += 1
+            for size in (size, 0):
+                self._addRule(original, imported, size)
+                if self._rewrite(original) == imported:
+                    break
+            else:
+                self._exceptions[original] = imported
+        self._paths.add(self._digest(original))
+        if original not in self._exceptions:
+            rule = self._rule(original)
+            for index in range(len(original), rule, -1):
+                if not self._dependents.add(self._digest(original[:index])):
+                    # Shorter prefixes are already recorded.
+                    break
+
+    def get(self, original):
+        original = tuple(original)
+        if self._digest(original) not in self._paths:
+            return None
+        imported = self._exceptions.get(original)
+        if imported is None:
+            imported = self._rewrite(original)
+        return imported
+
+    def __len__(self):
+        return len(self._paths)
+
+
+class CountingReader(object):
+    """Wrap a readable stream, counting the bytes read from it.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.read_size = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.read_size += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class ContentMethod(object):
+    """Method of a content, kept as the physical path of the content
+    and the name of the method, so actions waiting to be run don't
+    keep the content in memory across savepoints.
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+
+    @classmethod
+    def create(cls, method):
+        """Return a ContentMethod for a method bound to a content, or
+        method itself otherwise.
+        """
+        content = getattr(method, '__self__', None)
+        if (content is None or not hasattr(content, 'getPhysicalPath') or
+            getattr(content, method.__name__, None) != method):
+            return method
+        return cls(content.getPhysicalPath(), method.__name__)
+
+    def resolve(self, root):
+        """Return the method, bound to the content traversed from root.
+        """
+        return getattr(root.unrestrictedTraverse(self.path), self.name)
+
+
+# Phases in which actions are run at the end of an import.
+RESOLVE_PHASE = 0
+REFERENCE_PHASE = 1
+NOTIFY_PHASE = 2
+PHASES = (RESOLVE_PHASE, REFERENCE_PHASE, NOTIFY_PHASE)
 
 
 class Importer(object):
@@ -17,17 +206,49 @@ class Importer(object):
     """
 
     def __init__(self, root, request, options=None):
-        self.__actions = []
-        self.__problems = []
+        self.__phases = [collections.OrderedDict() for phase in PHASES]
+        self.__traversals = {'hits': 0, 'misses': 0}
         self.__root = root
-        self.__paths = {}
+        self.__paths = ImportedPaths()
+        self.__identifiers = {}
+        self.__probes = {}
+        self.__metadata_schemas = {}
+        self.__unknown_metadata = {}
         self.__request = request
         self.__executed = False
         self.__executing = False
         self.options = options or {}
+        self.statistics = Statistics.create(self.options.get('statistics'))
+        settings = registry.getOptions(self.options)
+        self.problems = Problems(settings.problems_limit)
+        self.indexing = None
+        if settings.defer_indexing:
+            self.indexing = DeferredIndexing(settings.indexing_batch_size)
+        self.savepoint_objects = settings.savepoint_objects
+        self.savepoint_bytes = settings.savepoint_bytes
+        self.savepoints = 0
+        self.checkpoint_objects = settings.checkpoint_objects
+        self.commits = 0
+        self.checkpoint = None
+        if settings.checkpoint:
+            if not self.checkpoint_objects:
+                # Committing the transaction must be asked explicitly.
+                raise ValueError(
+                    'The checkpoint option requires checkpoint_objects')
+            self.checkpoint = Checkpoint(settings.checkpoint)
+        self.__parsing = False
+        self.__source = None
+        self.__changed = 0
+        self.__uncommitted = 0
+        self.__saved_size = 0
         self.options.update({
                 'ignore_not_allowed': True,
                 'import_filter': collapser.CollapsingHandler})
+        if self.statistics is not None:
+            self.options['import_filter'] = self._importFilter
+        if self.checkpoint is not None:
+            self.__filter = self.options['import_filter']
+            self.options['import_filter'] = self._checkpointFilter
 
     @property
     def request(self):
@@ -42,16 +263,74 @@ class Importer(object):
         """
         return None
 
-    def reportProblem(self, reason, content):
+    def reportProblem(self, reason, content, count=1):
         """Report a new problem that happened during the import.
         """
-        self.__problems.append((reason, content))
+        self.problems.add(reason, content, count)
 
     def getProblems(self):
         """Return the list of the currently known problems with the
-        import.
+        import. Identical problems are listed once.
+        """
+        return self.problems.getProblems(self.__root)
+
+    def getStatistics(self):
+        """Return statistics about the import handlers and actions, if
+        the statistics option is set.
+        """
+        if self.statistics is None:
+            return {}
+        return self.statistics.getStatistics()
+
+    def getMetadataSchema(self, binding):
+        """Return the elements that can be written in each metadata
+        set of the given binding, with their field and deserializer.
+        """
+        key = binding.getSetNames()
+        schema = self.__metadata_schemas.get(key)
+        if schema is None:
+            schema = self.__metadata_schemas[key] = {}
+            for set_id in key:
+                elements = schema[set_id] = {}
+                for element in binding.getSet(set_id).getElements():
+                    if element.read_only_p and not element.automatic_p:
+                        continue
+                    field = element.field
+                    elements[element.getId()] = (
+                        field, field.validator.deserializeValue)
+        return schema
+
+    def reportUnknownMetadata(self, set_id, element_id=None):
+        """Report an unknown metadata set, or element of set, present
+        in the import.
         """
-        return list(self.__problems)
+        key = (set_id, element_id)
+        self.__unknown_metadata[key] = self.__unknown_metadata.get(key, 0) + 1
+
+    def getUnknownMetadata(self):
+        """Return how many times each unknown metadata set, or element
+        of a set, have been found in the import.
+        """
+        return dict(self.__unknown_metadata)
+
+    def _logUnknownMetadata(self):
+        for key, count in sorted(self.__unknown_metadata.items()):
+            set_id, element_id = key
+            if element_id is None:
+                logger.warn(
+                    u"Unknown metadata set %s present %d times in import "
+                    u"file.", set_id, count)
+            else:
+                logger.warn(
+                    u"Unknown metadata element %s in set %s present %d "
+                    u"times in import file.", element_id, set_id, count)
+
+    def _importFilter(self, handler):
+        return StatisticsHandler(
+            collapser.CollapsingHandler(handler), handler, self.statistics)
+
+    def _checkpointFilter(self, handler):
+        return CheckpointHandler(self.__filter(handler), self.checkpoint)
 
     def importStream(self, source):
         """Import the XML provided by the file object source.
@@ -60,86 +339,513 @@ class Importer(object):
             if self.__executing:
                 raise AssertionError('Currently importing')
             self.__executing = True
-            registry.importFromStream(
-                source,
-                result=self.__root,
-                options=self.options,
-                extra=self)
-            # run post-processing actions
-            self.runActions()
+            if self.statistics is not None:
+                with self.statistics.profile():
+                    self._importStream(source)
+            else:
+                self._importStream(source)
             self.__executed = True
         return self
 
+    def _importStream(self, source):
+        if self.indexing is not None:
+            self.indexing.start()
+        if self.savepoint_bytes:
+            source = self.__source = CountingReader(source)
+        if self.checkpoint is not None:
+            state = self.checkpoint.load()
+            if state is not None:
+                self._restoreCheckpoint(state)
+        self.__parsing = True
+        registry.importFromStream(
+            source,
+            result=self.__root,
+            options=self.options,
+            extra=self)
+        self.__parsing = False
+        # run post-processing actions
+        self.runActions()
+        self._logUnknownMetadata()
+        if self.checkpoint is not None:
+            transaction.commit()
+            self.checkpoint.remove()
+
+    def _saveCheckpoint(self):
+        self.checkpoint.save({
+                'root': self.__root.getPhysicalPath(),
+                'paths': self.__paths,
+                'problems': self.problems,
+                'notifications': list(
+                    self.__phases[NOTIFY_PHASE].get(
+                        self._notifyImported, []))})
+
+    def _restoreCheckpoint(self, state):
+        if state['root'] != self.__root.getPhysicalPath():
+            raise ValueError(
+                u"Checkpoint {0} is about an import in {1}.".format(
+                    self.checkpoint.filename, '/'.join(state['root'])))
+        logger.info(
+            u"Resume import from checkpoint %s, skipping %d elements.",
+            self.checkpoint.filename,
+            sum(end - start for start, end in self.checkpoint.skipped))
+        self.__paths = state['paths']
+        self.problems = state['problems']
+        for path in state['notifications']:
+            self.notifyImported(path)
+        # Content that is not skipped was partly imported. Replacing
+        # it would delete its committed contents, that are skipped.
+        if self.options.get('replace_content'):
+            logger.warning(
+                u"Resumed import updates content instead of replacing it.")
+        self.options['replace_content'] = False
+        self.options['update_content'] = True
+
+    def getIdentifiers(self, container):
+        """Return the set of identifiers used inside the given
+        container. It is computed once and kept up to date during the
+        import.
+        """
+        key = container.getPhysicalPath()
+        identifiers = self.__identifiers.get(key)
+        if identifiers is None:
+            identifiers = self.__identifiers[key] = set(container.objectIds())
+        return identifiers
+
+    def hasIdentifier(self, container, identifier):
+        """Return True if identifier is used inside the given
+        container. Content added to it outside of the importer, by an
+        event subscriber for instance, is added to its identifiers.
+        """
+        identifiers = self.getIdentifiers(container)
+        if identifier in identifiers:
+            return True
+        if container._getOb(identifier, None) is not None:
+            identifiers.add(identifier)
+            return True
+        return False
+
+    def addIdentifier(self, container, identifier):
+        """Remember that identifier is used inside the given container.
+        """
+        self.getIdentifiers(container).add(identifier)
+
+    def removeIdentifier(self, container, identifier):
+        """Remember that identifier is no longer used inside the given
+        container.
+        """
+        self.getIdentifiers(container).discard(identifier)
+
+    def getUniqueIdentifier(self, container, identifier):
+        """Return an identifier based on the given one that is not
+        used inside the given container.
+        """
+        if not self.hasIdentifier(container, identifier):
+            return identifier
+        # Start after the last suffix given for this identifier.
+        key = (container.getPhysicalPath(), identifier)
+        test = self.__probes.get(key, 0)
+        while True:
+            test += 1
+            add = ''
+            if test > 1:
+                add = str(test)
+            unique = 'import%s_of_%s' % (add, identifier)
+            if not self.hasIdentifier(container, unique):
+                break
+        self.__probes[key] = test
+        return unique
+
     def addImportedPath(self, original, imported):
         """Remenber that the original imported path as been imported
         with the given new one.
         """
-        self.__paths[u'/'.join(original)] = u'/'.join(imported)
+        self.__paths.set(original, imported)
+        # This is called once for each imported content and version.
+        self._changed()
+
+    def _changed(self):
+        # Commit, or take a savepoint, if enough content changed or
+        # was parsed.
+        self.__changed += 1
+        self.__uncommitted += 1
+        if (self.checkpoint is not None and self.__parsing and
+            self.__uncommitted >= self.checkpoint_objects):
+            self.commit()
+        elif ((self.savepoint_objects and
+               self.__changed >= self.savepoint_objects) or
+              (self.savepoint_bytes and self.__source is not None and
+               self.__source.read_size - self.__saved_size >=
+               self.savepoint_bytes)):
+            self.savepoint()
+
+    def savepoint(self):
+        """Take a savepoint of the transaction, and release the
+        content that is no longer used from the ZODB cache.
+        """
+        transaction.savepoint(optimistic=True)
+        self.savepoints += 1
+        self._release()
+
+    def commit(self):
+        """Commit the transaction, save the progress of the import in
+        the checkpoint file, and release the content that is no longer
+        used from the ZODB cache. This is only done while the XML is
+        parsed, with the checkpoint and checkpoint_objects options.
+        """
+        transaction.commit()
+        self._saveCheckpoint()
+        if self.indexing is not None:
+            # The cataloging of the transaction was done.
+            self.indexing.start()
+        self.commits += 1
+        self.__uncommitted = 0
+        self._release()
+
+    def _release(self):
+        connection = getattr(self.__root, '_p_jar', None)
+        if connection is not None:
+            connection.cacheGC()
+        self.__changed = 0
+        if self.__source is not None:
+            self.__saved_size = self.__source.read_size
 
     def getImportedPath(self, path):
         """Return an imported path for the given original one.
         """
-        return self.__paths.get(path)
+        imported = self.__paths.get(path.split('/') if path else [])
+        if imported is None:
+            return None
+        return u'/'.join(imported)
 
     def resolveImportedPath(self, content, setter, path):
-        """Resolve an imported path for a given content.
+        """Resolve an imported path for a given content. setter is
+        called with the target. If it is a method of a content, only
+        the path of that content is kept until then: prefer them to
+        closures, that keep the content they use in memory.
         """
         if not path:
             self.reportProblem("Missing imported path.", content)
             return
+        self.addBatchAction(
+            self._resolveImportedPaths,
+            (path, content.getPhysicalPath(), ContentMethod.create(setter)),
+            RESOLVE_PHASE)
 
-        def action():
+    def getTraversalStatistics(self):
+        """Return how many traversal steps have been served from the
+        cache (hits) or done on the content (misses) while resolving
+        imported paths.
+        """
+        return dict(self.__traversals)
+
+    def _traverseImportedPath(self, path, cache):
+        # The cache is the list of the (identifier, content) traversed
+        # for the previous path. As paths are traversed in order, only
+        # their common prefix is reused.
+        index = 0
+        while (index < len(cache) and index < len(path) and
+               cache[index][0] == path[index]):
+            index += 1
+        del cache[index:]
+        target = cache[-1][1] if cache else self.root
+        self.__traversals['hits'] += index
+        while index < len(path):
+            target = target.unrestrictedTraverse([path[index]])
+            cache.append((path[index], target))
+            index += 1
+            self.__traversals['misses'] += 1
+        return target
+
+    def _resolveImportedPaths(self, resolutions):
+        for path, content_path, setter in resolutions:
             if path[0:5] == 'root:':
                 imported_path = path[5:]
             else:
                 imported_path = self.getImportedPath(canonical_path(path))
             if not imported_path:
-                self.reportProblem(
+                self.problems.addPath(
                     "Refering inexisting path {0} in the import.".format(path),
-                    content)
-                return
+                    content_path)
+                continue
+            self.addBatchAction(
+                self._setTargets,
+                (tuple(map(str, imported_path.split('/'))),
+                 imported_path, content_path, setter),
+                REFERENCE_PHASE)
+
+    def _setTargets(self, targets):
+        # Resolve paths in order, so siblings share their parents lookups.
+        targets.sort(key=operator.itemgetter(0))
+        cache = []
+        for path, imported_path, content_path, setter in targets:
             try:
-                target = self.root.unrestrictedTraverse(
-                    map(str, imported_path.split('/')))
+                target = self._traverseImportedPath(path, cache)
             except (KeyError, AttributeError):
-                self.reportProblem(
+                self.problems.addPath(
                     "Refered path {0} is not found in the import.".format(
                         imported_path),
-                    content)
+                    content_path)
+                continue
+            if isinstance(setter, ContentMethod):
+                try:
+                    setter = setter.resolve(self.root)
+                except (KeyError, AttributeError):
+                    self.problems.addPath(
+                        "Imported content {0} is not found.".format(
+                            '/'.join(setter.path)),
+                        content_path)
+                    continue
+            try:
+                setter(target)
+            except Error as error:
+                self.problems.addPath(error.reason, content_path)
+            self._changed()
+
+    def notifyImported(self, path):
+        """Notify that the content at the given physical path has been
+        imported, at the end of the import.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.complete()
+        self.addBatchAction(self._notifyImported, path, NOTIFY_PHASE)
+
+    def _notifyImported(self, paths):
+        cache = []
+        # Resumed imports can notify the same content twice.
+        for path in sorted(set(paths)):
+            try:
+                content = self._traverseImportedPath(path, cache)
+            except (KeyError, AttributeError):
+                self.reportProblem(
+                    "Imported content {0} is not found.".format(
+                        '/'.join(path)),
+                    None)
             else:
+                notify(ContentImported(content))
+                self._changed()
+
+    def _runActions(self, actions):
+        for action, args in actions:
+            if isinstance(action, ContentMethod):
                 try:
-                    setter(target)
-                except Error as error:
-                    self.reportProblem(error.reason, content)
+                    action = action.resolve(self.root)
+                except (KeyError, AttributeError):
+                    self.reportProblem(
+                        "Imported content {0} is not found.".format(
+                            '/'.join(action.path)),
+                        None)
+                    continue
+            if self.statistics is None:
+                action(*args)
+            else:
+                with self.statistics.measure(action):
+                    action(*args)
 
-        self.addAction(action)
+    def addAction(self, action, args=[], phase=REFERENCE_PHASE):
+        """Add an action to be executed in a later stage, during the
+        given phase. If action is a method of a content, only the path
+        of that content is kept until then.
+        """
+        self.addBatchAction(
+            self._runActions, (ContentMethod.create(action), args), phase)
 
-    def addAction(self, action, args=[]):
-        """Add an action to be executed in a later stage.
+    def addBatchAction(self, action, item, phase=REFERENCE_PHASE):
+        """Add an item to be processed in a later stage. During the
+        given phase, action is called once with the list of all the
+        items added for it, in the order they were added.
         """
-        self.__actions.append((action, args))
+        if (self.checkpoint is not None and self.__parsing and
+            action != self._notifyImported):
+            # This action is lost if the import is resumed.
+            self.checkpoint.queued()
+        self.__phases[phase].setdefault(action, []).append(item)
 
     def runActions(self, clear=True):
-        """Run scheduled actions.
+        """Run scheduled actions, phase by phase: imported paths are
+        resolved, references are set, then events are notified. Actions
+        can add more actions to run in any phase: after each action,
+        the actions of the earliest phase that has some are run first.
+        Content whose indexing was deferred is cataloged last.
+        """
+        if not clear:
+            kept = [collections.OrderedDict(
+                    (action, list(items)) for action, items in batches.items())
+                    for batches in self.__phases]
+        statistics = self.statistics
+        phase = 0
+        while phase < len(self.__phases):
+            batches = self.__phases[phase]
+            if not batches:
+                phase += 1
+                continue
+            if phase == REFERENCE_PHASE and self._setTargets in batches:
+                # Targets are set before the other reference actions.
+                action = self._setTargets
+                items = batches.pop(action)
+            else:
+                action, items = batches.popitem(last=False)
+            if statistics is None or action == self._runActions:
+                action(items)
+            else:
+                with statistics.measure(action):
+                    action(items)
+            phase = 0
+        if not clear:
+            self.__phases = kept
+        if self.indexing is not None:
+            if statistics is None:
+                self.indexing.flush()
+            else:
+                with statistics.measure(DeferredIndexing):
+                    self.indexing.flush()
+
+
+class ZipMemberFile(object):
+    """Read-only seekable file on a stored (not compressed) member of
+    a Zip archive. Data is read lazily from the archive stream.
+    """
+
+    def __init__(self, stream, offset, size):
+        self._stream = stream
+        self._offset = offset
+        self._size = size
+        self._position = 0
+        self.closed = False
+
+    def read(self, size=-1):
+        remaining = self._size - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b''
+        self._stream.seek(self._offset + self._position)
+        data = self._stream.read(size)
+        self._position += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self._size
+        self._position = max(0, min(offset, self._size))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def getbuffer(self):
+        """Return a read-only view on the member data. Unlike with
+        read, the data is not copied if the archive is memory mapped,
+        until the end of the import.
         """
-        for action, args in self.__actions:
-            action(*args)
-        if clear is True:
-            del self.__actions[:]
+        view = getattr(self._stream, 'view', None)
+        if view is not None:
+            return view(self._offset, self._offset + self._size)
+        self._stream.seek(self._offset)
+        return memoryview(self._stream.read(self._size))
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 class ZipImporter(Importer):
+    """Import a Zip archive containing a silva.xml file, and the
+    assets and zexps it refers to.
+
+    The XML is parsed straight out of the archive. Stored members are
+    returned as lazy streams on the archive, compressed ones are
+    inflated into spooled temporary files. The most recently inflated
+    members are kept, so that a member shared by several contents (like
+    a deduplicated asset) is only inflated once.
+
+    Compressed assets are inflated ahead of time by prefetch_threads
+    threads, in the order of their identifiers, that is the order in
+    which they appear in the XML. Content is still created in the main
+    thread.
+
+    An archive on the disk can be imported with importFile, that maps
+    it in memory during the import. Members are then read out of the
+    mapping instead of a shared file, their data is still copied when
+    it is read.
+    """
+    # Size above which inflated members are spooled on the disk.
+    spool_size = 1 << 20
+    # Total size of the inflated members that are kept.
+    inflated_size = 1 << 26
+    # Total size of the prefetched members waiting to be used.
+    prefetch_size = 1 << 25
+    # Size of the chunks used to read members.
+    chunk_size = 1 << 16
 
     def __init__(self, root, request, options=None):
         super(ZipImporter, self).__init__(root, request, options)
         self.__archive = None
+        self.__stream = None
+        self.__mapping = None
+        self.__lock = threading.Lock()
+        self.__inflated = collections.OrderedDict()
+        self.__inflated_size = 0
+        self.__pool = None
+        self.__prefetch = collections.deque()
+        self.__prefetched = {}
+        self.__prefetched_size = 0
 
     def importStream(self, stream):
         if self.__archive is not None:
             raise ValueError('Already importing')
-        self.__archive = zipfile.ZipFile(stream)
-        super(ZipImporter, self).importStream(
-            io.BytesIO(self.__archive.read('silva.xml')))
+        # The stream is shared with the prefetching threads.
+        self.__stream = stream
+        self.__archive = zipfile.ZipFile(self._openArchive())
+        threads = registry.getOptions(self.options).prefetch_threads
+        if threads:
+            self.__prefetch.extend(self._getPrefetchOrder())
+            if self.__prefetch:
+                self.__pool = WorkerPool(threads)
+                self._prefetch()
+        source = self.__archive.open('silva.xml')
+        try:
+            super(ZipImporter, self).importStream(source)
+        finally:
+            source.close()
+            if self.__pool is not None:
+                # Pending jobs are done once the pool is closed.
+                self.__pool.close()
+                self.__pool = None
+            for job in self.__prefetched.values():
+                if job.spool is not None:
+                    job.spool.close()
+            for spool in self.__inflated.values():
+                spool.close()
+            self.__inflated.clear()
+            self.__inflated_size = 0
+            self.__prefetch.clear()
+            self.__prefetched.clear()
+            self.__prefetched_size = 0
+
+    def importFile(self, filename):
+        """Import the Zip archive stored in the file filename. The file
+        is mapped in memory during the import.
+        """
+        with open(filename, 'rb') as stream:
+            mapping = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__mapping = mapping
+        try:
+            return self.importStream(mapping)
+        finally:
+            self.__mapping = None
+            try:
+                mapping.close()
+            except BufferError:
+                # A view on a member is still used, the file is
+                # unmapped once the mapping is garbage collected.
+                pass
 
     def getFile(self, filename):
         """Return content of a file
@@ -147,9 +853,98 @@ class ZipImporter(Importer):
         if self.__archive is None:
             return None
         try:
-            return io.BytesIO(self.__archive.read(filename))
+            info = self.__archive.getinfo(filename)
         except KeyError:
             return None
+        if (info.compress_type == zipfile.ZIP_STORED and
+            not info.flag_bits & 0x1):
+            return self._openStored(info)
+        return self._openSpooled(info)
+
+    def _getPrefetchOrder(self):
+        # Asset identifiers are numbered in the order of the export.
+        assets = []
+        for info in self.__archive.infolist():
+            if (info.filename.startswith('assets/') and
+                info.compress_type == zipfile.ZIP_DEFLATED and
+                not info.flag_bits & 0x1):
+                # Assets of fragments are numbered index_number.
+                number = info.filename[7:].split('.', 1)[0].split('_')
+                if all(part.isdigit() for part in number):
+                    number = tuple(map(int, number))
+                else:
+                    number = (sys.maxsize,)
+                assets.append((number, info.filename, info))
+        assets.sort(key=operator.itemgetter(0, 1))
+        return [info for number, filename, info in assets]
+
+    def _prefetch(self):
+        while (self.__prefetch and
+               self.__prefetched_size < self.prefetch_size):
+            info = self.__prefetch.popleft()
+            if (info.filename in self.__prefetched or
+                info.filename in self.__inflated):
+                continue
+            self.__prefetched[info.filename] = self.__pool.submit(
+                InflateJob(self._inflate, info))
+            self.__prefetched_size += info.file_size
+
+    def _inflate(self, info):
+        # Called from the prefetching threads as well.
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        try:
+            if info.compress_type == zipfile.ZIP_DEFLATED:
+                inflate(self._openArchive(), info, spool, self.chunk_size)
+            else:
+                if info.flag_bits & 0x1:
+                    raise RuntimeError(
+                        'Member %s is encrypted' % info.filename)
+                # Read through a view of its own: on Python 2, members
+                # opened by the archive share its file and position,
+                # that silva.xml is read from.
+                stream = self._openArchive()
+                stream.seek(get_data_offset(stream, info))
+                source = zipfile.ZipExtFile(stream, 'r', info)
+                try:
+                    shutil.copyfileobj(source, spool, self.chunk_size)
+                finally:
+                    source.close()
+        except:
+            spool.close()
+            raise
+        return spool
+
+    def _openArchive(self):
+        # Return a view on the archive that can be used at the same
+        # time than the other ones.
+        if self.__mapping is not None:
+            return MappedFile(self.__mapping)
+        return SharedFile(self.__stream, self.__lock)
+
+    def _openStored(self, info):
+        stream = self._openArchive()
+        return ZipMemberFile(
+            stream, get_data_offset(stream, info), info.file_size)
+
+    def _openSpooled(self, info):
+        spool = self.__inflated.pop(info.filename, None)
+        if spool is None:
+            job = self.__prefetched.pop(info.filename, None)
+            if job is not None:
+                self.__prefetched_size -= info.file_size
+                spool = job.result()
+            else:
+                spool = self._inflate(info)
+            self.__inflated_size += info.file_size
+            if self.__pool is not None:
+                self._prefetch()
+        self.__inflated[info.filename] = spool
+        while (self.__inflated_size > self.inflated_size and
+               len(self.__inflated) > 1):
+            # Spools are closed once they are no longer used.
+            filename, previous = self.__inflated.popitem(last=False)
+            self.__inflated_size -= self.__archive.getinfo(filename).file_size
+        return ZipMemberFile(spool, 0, info.file_size)
 
 
 registry = xmlimport.Importer()
@@ -157,3 +952,21 @@ registry = xmlimport.Importer()
 registry.registerOption('replace_content', False)
 registry.registerOption('update_content', False)
 registry.registerOption('ignore_top_level_content', False)
+# Collect statistics (True), and profile the import ('profile')
+registry.registerOption('statistics', False)
+# Maximum number of distinct problems that are kept
+registry.registerOption('problems_limit', 1000)
+# Catalog imported content in batches at the end of the import
+registry.registerOption('defer_indexing', False)
+registry.registerOption('indexing_batch_size', 500)
+# Take a savepoint after importing this number of contents, or parsing
+# this number of bytes (0 to disable)
+registry.registerOption('savepoint_objects', 0)
+registry.registerOption('savepoint_bytes', 0)
+# Save the progress of the import in this file, resuming from it if it
+# exists. The transaction is committed, and the progress saved, after
+# importing checkpoint_objects contents, and at the end of the import.
+registry.registerOption('checkpoint', None)
+registry.registerOption('checkpoint_objects', 0)
+# Number of threads inflating assets ahead of time (only with ZipImporter)
+registry.registerOption('prefetch_threads', 2)